@@ -0,0 +1,377 @@
+import logging
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from typing import NamedTuple
+
+import requests
+
+from timestamps import SOURCE_IDS, SOURCE_NAMES, format_iso, local_datetime, now_ms, to_ms
+
+logger = logging.getLogger(__name__)
+
+# Defaults for the ALERT_* settings
+HYSTERESIS = 0.5            # °C an apparent temperature must fall below a band's lower edge to leave it
+MIN_SECONDS = 60            # A new level must hold this long (in reading time) before it is confirmed
+MAX_GAP_SECONDS = 600       # Longest gap between two readings counted as exposure
+NOTIFY_MAX_AGE_SECONDS = 900  # Transitions in older readings (backfills, replays) are recorded, not notified
+CATCH_UP_ROWS = 5000        # Readings evaluated per transaction by AlertEngine.catch_up()
+
+# Shift names and their local start hours; each runs until the next one starts
+SHIFTS = (("day", 6), ("night", 18))
+
+
+class AlertRule(NamedTuple):
+    hysteresis: float = HYSTERESIS
+    min_seconds: float = MIN_SECONDS
+
+
+class Alert(NamedTuple):
+    ts: int             # Epoch ms of the reading that confirmed the transition
+    source: str
+    device_id: str
+    previous: str       # Level label before the transition
+    level: str          # Level label after it
+    apparent: float
+
+    def as_dict(self):
+        return dict(self._asdict(), timestamp=format_iso(self.ts))
+
+
+class _SensorState:
+    # Everything the engine remembers per sensor: a few numbers, whatever the reading rate
+    __slots__ = ("thresholds", "level", "candidate", "candidate_since", "last_ts",
+                 "shift_start", "shift_end", "shift")
+
+    def __init__(self, thresholds, level):
+        self.thresholds = thresholds
+        self.level = level              # Confirmed band index
+        self.candidate = None           # Band index waiting out its minimum duration
+        self.candidate_since = None
+        self.last_ts = None
+        self.shift_start = self.shift_end = None
+        self.shift = None
+
+
+def shift_of(ts, shifts=SHIFTS):
+    """
+    (shift start ms, shift name, shift end ms) of the shift containing epoch-ms `ts`.
+    A shift that crosses midnight belongs to the day it started on.
+    """
+    local = local_datetime(ts).replace(tzinfo=None)
+    day = local.replace(hour=0, minute=0, second=0, microsecond=0)
+    starts = sorted(shifts, key=lambda shift: shift[1])
+    # Shift starts from yesterday to tomorrow, in order, to find the one ts falls into
+    boundaries = [(day + timedelta(days=offset, hours=hour), name)
+                  for offset in (-1, 0, 1) for name, hour in starts]
+    for (start, name), (end, _) in zip(boundaries, boundaries[1:]):
+        if start <= local < end:
+            return to_ms(start), name, to_ms(end)
+    raise ValueError("Shifts must start within a day")
+
+
+def init_alerts(conn):
+    # Transition log and per-shift exposure totals, next to the readings they are derived from
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS alerts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            ts INTEGER NOT NULL,            -- Epoch ms of the confirming reading
+            source_id INTEGER NOT NULL,
+            device_id TEXT NOT NULL,
+            previous TEXT NOT NULL,
+            level TEXT NOT NULL,
+            apparent REAL NOT NULL
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_alerts_ts ON alerts (ts)")
+    # Engine state per sensor, saved with every batch so a restart carries on where it stopped
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS alert_sensors (
+            source_id INTEGER NOT NULL,
+            device_id TEXT NOT NULL,
+            level TEXT NOT NULL,            -- Confirmed level label
+            candidate TEXT,                 -- Level label waiting out its minimum duration
+            candidate_since INTEGER,
+            last_ts INTEGER NOT NULL,       -- Epoch ms of the last reading evaluated
+            PRIMARY KEY (source_id, device_id)
+        ) WITHOUT ROWID
+    ''')
+    # The engine's place in the readings table; it starts after whatever is already stored
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS alert_progress (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            reading_id INTEGER NOT NULL     -- Highest readings.id evaluated
+        )
+    ''')
+    conn.execute('''
+        INSERT OR IGNORE INTO alert_progress (id, reading_id)
+        SELECT 1, coalesce(max(id), 0) FROM readings
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS exposure (
+            shift_start INTEGER NOT NULL,   -- Epoch ms the shift started
+            shift TEXT NOT NULL,
+            source_id INTEGER NOT NULL,
+            device_id TEXT NOT NULL,
+            level TEXT NOT NULL,
+            seconds REAL NOT NULL,
+            PRIMARY KEY (shift_start, source_id, device_id, level)
+        ) WITHOUT ROWID
+    ''')
+
+
+class AlertEngine:
+    """
+    Evaluates every stored reading, whichever process stored it, by following the
+    readings table in id order (catch_up). Per sensor it keeps only the confirmed
+    level, a pending candidate level and the last reading and shift, so the cost per
+    reading is constant whoever is watching.
+
+    - Hysteresis: leaving a band downwards needs the apparent temperature to drop the
+      band rule's `hysteresis` below that band's lower edge.
+    - Minimum duration: a new level is confirmed only once readings have stayed in it
+      for the target band rule's `min_seconds` (measured in reading time, so replays
+      and backfills behave the same as live data).
+    - Exposure: the time between consecutive readings (capped at max_gap_seconds) is
+      added to the sensor's confirmed level for the shift it falls in.
+    - A sensor seen for the first time starts out Safe, so one that comes up in a risk
+      band still raises its transition.
+
+    Confirmed transitions are written to the alerts table and passed to `sink`.
+    """
+
+    def __init__(self, sink, rules=None, default_rule=AlertRule(), shifts=SHIFTS,
+                 max_gap_seconds=MAX_GAP_SECONDS, notify_max_age_seconds=NOTIFY_MAX_AGE_SECONDS):
+        self.sink = sink
+        self.rules = {label: AlertRule(**rule) for label, rule in (rules or {}).items()}
+        self.default_rule = default_rule
+        self.shifts = shifts
+        self.max_gap_ms = max_gap_seconds * 1000
+        self.notify_max_age_ms = notify_max_age_seconds * 1000
+        self.cursor = None      # alert_progress.reading_id the in-memory state matches
+        self._states = {}
+        self._lock = threading.Lock()
+
+    def rule(self, thresholds, level):
+        return self.rules.get(thresholds.labels[level], self.default_rule)
+
+    @staticmethod
+    def safe_level(thresholds):
+        # Band index of the Safe band, the level every sensor is assumed to start from
+        return thresholds.classify_index(thresholds.safe_limit)
+
+    def warm(self, conn, thresholds):
+        """
+        Restores every sensor's state and the cursor as saved with the last batch
+        processed, so a restart (or another process taking over) neither repeats nor
+        misses a transition. Sensors only known from the alerts table (saved before
+        per-sensor state was) get the level of their latest transition.
+        """
+        self._states.clear()
+        self.cursor = conn.execute("SELECT reading_id FROM alert_progress").fetchone()[0]
+        rows = conn.execute('''
+            SELECT source_id, device_id, level, max(ts) FROM alerts GROUP BY source_id, device_id
+        ''').fetchall()
+        for source_id, device_id, label, _ in rows:
+            if label in thresholds.labels:
+                state = _SensorState(thresholds, thresholds.labels.index(label))
+                self._states[(SOURCE_NAMES[source_id], device_id)] = state
+        rows = conn.execute('''
+            SELECT source_id, device_id, level, candidate, candidate_since, last_ts FROM alert_sensors
+        ''').fetchall()
+        for source_id, device_id, label, candidate, candidate_since, last_ts in rows:
+            level = thresholds.labels.index(label) if label in thresholds.labels else self.safe_level(thresholds)
+            state = _SensorState(thresholds, level)
+            if candidate in thresholds.labels:
+                state.candidate, state.candidate_since = thresholds.labels.index(candidate), candidate_since
+            state.last_ts = last_ts
+            state.shift_start, state.shift, state.shift_end = shift_of(last_ts, self.shifts)
+            self._states[(SOURCE_NAMES[source_id], device_id)] = state
+
+    def _state(self, key, thresholds):
+        state = self._states.get(key)
+        if state is None:
+            # First reading from this sensor: it starts out Safe, so a sensor that comes up in a
+            # risk band raises the transition once that level holds like any other
+            state = self._states[key] = _SensorState(thresholds, self.safe_level(thresholds))
+        elif state.thresholds is not thresholds:
+            # Bands were edited: carry the level over by label, or start again from Safe
+            label = state.thresholds.labels[state.level]
+            state.level = (thresholds.labels.index(label) if label in thresholds.labels
+                           else self.safe_level(thresholds))
+            state.thresholds, state.candidate = thresholds, None
+        return state
+
+    def catch_up(self, conn, thresholds, limit=CATCH_UP_ROWS):
+        """
+        Evaluates the readings stored since the cursor and returns the Alerts confirmed.
+        Each chunk commits together with the sensors' state and the new cursor, so every
+        reading counts exactly once, even when the work moves to another process. If
+        another process moved the cursor since this one last ran, the state is reloaded
+        first. Meant to run in one process at a time (the scheduler leader).
+        """
+        alerts = []
+        with self._lock:
+            while True:
+                try:
+                    with conn:
+                        conn.execute("BEGIN IMMEDIATE")
+                        cursor = conn.execute("SELECT reading_id FROM alert_progress").fetchone()[0]
+                        if cursor != self.cursor:
+                            self.warm(conn, thresholds)
+                        rows = conn.execute('''
+                            SELECT id, ts, source_id, temperature, humidity, apparent, device_id
+                            FROM readings
+                            WHERE id > ?
+                            ORDER BY id
+                            LIMIT ?
+                        ''', (cursor, limit)).fetchall()
+                        if rows:
+                            alerts += self.process(conn, [
+                                (ts, SOURCE_NAMES[source_id], temp, rh, apparent, device_id)
+                                for _, ts, source_id, temp, rh, apparent, device_id in rows
+                            ], thresholds)
+                            conn.execute("UPDATE alert_progress SET reading_id = ?", (rows[-1][0],))
+                except Exception:
+                    # The in-memory state may be ahead of what was saved; reload it next time
+                    self.cursor = None
+                    raise
+                if not rows:
+                    return alerts
+                self.cursor = rows[-1][0]
+                if len(rows) < limit:
+                    return alerts
+
+    def process(self, conn, rows, thresholds):
+        """
+        Runs stored readings rows (ts, source, temperature, humidity, apparent, device_id)
+        through the rules inside the caller's transaction on `conn`, saves the state of
+        every sensor they touched, and returns the Alerts confirmed. Readings not newer
+        than a sensor's last one are ignored.
+        """
+        alerts = []
+        exposure = defaultdict(float)
+        touched = set()
+        for ts, source, _, _, apparent, device_id in sorted(rows, key=lambda row: row[0]):
+            state = self._state((source, device_id), thresholds)
+            if state.last_ts is not None:
+                if ts <= state.last_ts:
+                    continue
+                seconds = min(ts - state.last_ts, self.max_gap_ms) / 1000
+                key = (state.shift_start, state.shift, SOURCE_IDS[source], device_id, thresholds.labels[state.level])
+                exposure[key] += seconds
+            state.last_ts = ts
+            touched.add((source, device_id))
+            if state.shift_end is None or not state.shift_start <= ts < state.shift_end:
+                state.shift_start, state.shift, state.shift_end = shift_of(ts, self.shifts)
+
+            raw = thresholds.classify_index(apparent)
+            if raw < state.level:
+                # Hysteresis: stay in the current band until clearly below it
+                hysteresis = self.rule(thresholds, state.level).hysteresis
+                if thresholds.classify_index(apparent + hysteresis) >= state.level:
+                    raw = state.level
+            if raw == state.level:
+                state.candidate = None
+                continue
+            if state.candidate != raw:
+                state.candidate, state.candidate_since = raw, ts
+            if ts - state.candidate_since >= self.rule(thresholds, raw).min_seconds * 1000:
+                alerts.append(Alert(ts, source, device_id, thresholds.labels[state.level],
+                                    thresholds.labels[raw], apparent))
+                state.level, state.candidate = raw, None
+
+        if alerts:
+            conn.executemany('''
+                INSERT INTO alerts (ts, source_id, device_id, previous, level, apparent)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', [(a.ts, SOURCE_IDS[a.source], a.device_id, a.previous, a.level, a.apparent) for a in alerts])
+        if exposure:
+            conn.executemany('''
+                INSERT INTO exposure (shift_start, shift, source_id, device_id, level, seconds)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (shift_start, source_id, device_id, level)
+                DO UPDATE SET seconds = seconds + excluded.seconds
+            ''', [(*key, seconds) for key, seconds in exposure.items()])
+        if touched:
+            conn.executemany('''
+                INSERT INTO alert_sensors (source_id, device_id, level, candidate, candidate_since, last_ts)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (source_id, device_id) DO UPDATE SET level = excluded.level,
+                    candidate = excluded.candidate, candidate_since = excluded.candidate_since,
+                    last_ts = excluded.last_ts
+            ''', [self._saved(key, thresholds) for key in touched])
+        return alerts
+
+    def _saved(self, key, thresholds):
+        # alert_sensors row for a sensor's state
+        state = self._states[key]
+        candidate = thresholds.labels[state.candidate] if state.candidate is not None else None
+        return (SOURCE_IDS[key[0]], key[1], thresholds.labels[state.level], candidate,
+                state.candidate_since if candidate else None, state.last_ts)
+
+    def notify(self, alerts):
+        # Hand fresh transitions to the sink (after commit); a failing sink never fails ingest
+        cutoff = now_ms() - self.notify_max_age_ms
+        fresh = [alert for alert in alerts if alert.ts >= cutoff]
+        if not fresh:
+            return
+        try:
+            self.sink(fresh)
+        except Exception:
+            logger.exception("Alert sink failed for %d alerts", len(fresh))
+
+
+# Notification sinks: callables taking a list of Alerts
+
+class LogSink:
+    def __call__(self, alerts):
+        for alert in alerts:
+            logger.warning("Heat alert: %s %s %s -> %s (apparent %.1f°C at %s)", alert.source, alert.device_id,
+                           alert.previous, alert.level, alert.apparent, format_iso(alert.ts))
+
+
+class MemorySink:
+    # Keeps the newest alerts in memory; stands in for a real sink locally and in tests
+    def __init__(self, limit=1000):
+        self.limit = limit
+        self.alerts = []
+
+    def __call__(self, alerts):
+        self.alerts.extend(alerts)
+        del self.alerts[:-self.limit]
+
+
+class WebhookSink:
+    # POSTs each batch of alerts as JSON from a background thread, so slow receivers never block ingest
+    def __init__(self, url, timeout=5):
+        self.url = url
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="alert-webhook")
+
+    def _post(self, payload):
+        try:
+            requests.post(self.url, json=payload, timeout=self.timeout).raise_for_status()
+        except requests.RequestException as e:
+            logger.warning("Alert webhook %s failed: %s", self.url, e)
+
+    def __call__(self, alerts):
+        self._executor.submit(self._post, {"alerts": [alert.as_dict() for alert in alerts]})
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+
+def make_sink(config):
+    # ALERT_SINK: "log", "memory", "webhook" (uses ALERT_WEBHOOK_URL) or any callable
+    sink = config.get("ALERT_SINK", "log")
+    if callable(sink):
+        return sink
+    if sink == "log":
+        return LogSink()
+    if sink == "memory":
+        return MemorySink()
+    if sink == "webhook":
+        return WebhookSink(config["ALERT_WEBHOOK_URL"])
+    raise ValueError(f"Unknown ALERT_SINK {sink!r}")
@@ -1,4 +1,6 @@
-from flask import Flask, render_template, request, redirect, flash, session
+from flask import (Flask, Blueprint, render_template, request, redirect, flash, session, Response, current_app,
+                   stream_with_context, g)
+import functools
 import sqlite3
 import os
 import re
@@ -7,21 +9,114 @@ from werkzeug.security import check_password_hash
 import math
 from flask import jsonify
 from datetime import datetime
-import requests
 import random
 from datetime import datetime, timedelta
 from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.events import EVENT_JOB_MISSED
 from random import uniform
-
-app = Flask(__name__)
-app.secret_key = 'secret_key'
-
-DB_PATH = "users.db"
+import click
+import threading
+import time
+import atexit
+import signal
+import db
+from db import get_db, DATABASES
+from events import broker
+from recent import recent
+from stats import stats, describe as describe_forecast
+from rollups import (GRANULARITIES, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, init_rollups, rebuild_rollups,
+                     pick_granularity, query_rollups)
+from bom import DEFAULT_STATIONS, LEGACY_STATION_ID, BomPoller, load_stations, station_zones
+from export import EXPORT_FORMATS, export_stream, iter_readings
+from archive import ArchiveStore, archive_readings, day_bounds, enable_incremental_vacuum, incremental_vacuum_enabled
+from simulator import SensorFleet, run_fleet, replay
+from alerts import AlertEngine, AlertRule, init_alerts, make_sink
+from leader import LeaderLease, init_leases
+from pagecache import page_cache, page_etag, readings_version, thresholds_version
+from metrics import REGISTRY, CONTENT_TYPE, Counter, Gauge, Histogram
+from writer import BatchTooLarge, QueueFull, WriteBehindQueue
+from frames import (ACK_BAD_FRAME, ACK_BUSY, ACK_OK, HEADER as FRAME_HEADER, MAX_FRAME_RECORDS, RECORD as FRAME_RECORD,
+                    FrameError, FrameListener, decode_device_id, parse_frame)
+from timestamps import (READINGS_SCHEMA, READINGS_INDEX, SOURCE_IDS, SOURCE_NAMES, MIN_MS, MAX_MS, now_ms, to_ms,
+                        parse_iso_ms, migrate_readings, format_iso, format_date, format_time, format_datetime)
+from apparent import calc_apparent, calc_apparent_array, recompute_apparent
+from thresholds import DEFAULT_BANDS, Thresholds, get_thresholds, level_style, invalidate as invalidate_thresholds
+
+# Default configuration; create_app() accepts overrides (e.g. temporary databases and a stub BOM URL in tests)
+DEFAULT_CONFIG = {
+    "SECRET_KEY": "secret_key",
+    # Database files used by the connection pools (see db.py)
+    "DATABASES": dict(DATABASES),
+    # BOM stations polled by /ingest/outside, the startup backfill and the scheduler: [{"id", "name", "url"}]
+    "BOM_STATIONS": DEFAULT_STATIONS,
+    "BOM_TIMEOUT": 10,
+    "BOM_POLL_MINUTES": 10,
+    # Start the scheduler and the deferred BOM backfill (servers only; off for tests and CLI commands)
+    "START_BACKGROUND": False,
+    # Minutes between simulated factory readings
+    "SIMULATE_INTERVAL_MINUTES": 5,
+    # Write-behind ingest: queue readings and return 202, committing them in group transactions (see writer.py)
+    "WRITE_BEHIND": False,
+    "WRITE_BEHIND_QUEUE_SIZE": 50000,
+    "WRITE_BEHIND_BATCH_SIZE": 1000,
+    "WRITE_BEHIND_FLUSH_SECONDS": 0.05,
+    # Alert engine evaluating every stored reading (see alerts.py). ALERT_SINK is "log", "memory", "webhook" or a
+    # callable; ALERT_RULES overrides hysteresis/min_seconds per band label, e.g. {"Very High Risk": {"min_seconds": 0}}
+    "ALERTS": True,
+    "ALERT_SINK": "log",
+    "ALERT_WEBHOOK_URL": None,
+    "ALERT_HYSTERESIS": 0.5,
+    "ALERT_MIN_SECONDS": 60,
+    "ALERT_RULES": {},
+    # Exposure accounting shifts: (name, local start hour)
+    "SHIFTS": (("day", 6), ("night", 18)),
+    # With START_BACKGROUND, processes sharing these databases (e.g. gunicorn workers) elect one scheduler
+    # leader through a lease in leases.db; a leader that stops renewing is replaced after this long
+    "LEADER_LEASE_SECONDS": 30,
+    # How often each process picks up readings stored by the others into its in-memory views
+    "CATCH_UP_SECONDS": 2.0,
+    # Retention (see archive.py): readings older than RETENTION_DAYS whole local days move from readings.db into
+    # per-day archive files in ARCHIVE_DIR (default: an "archive" folder beside readings.db); None keeps everything
+    "RETENTION_DAYS": 90,
+    "ARCHIVE_DIR": None,
+    "RETENTION_BATCH_ROWS": 5000,
+    "RETENTION_CHECK_MINUTES": 60,
+    # Sensor timestamps accepted at ingest: from READING_EARLIEST (ISO 8601, naive = local time) to this many seconds
+    # ahead of the server clock. One far-future reading would otherwise hide every later one from the live views
+    "READING_EARLIEST": "2020-01-01",
+    "READING_MAX_FUTURE_SECONDS": 300,
+    # Binary frame listeners (see frames.py), run by the scheduler leader: (host, port) or None
+    "FRAME_UDP": None,
+    "FRAME_TCP": None,
+}
+
+# All routes, template helpers and CLI commands; registered on the app by create_app()
+bp = Blueprint("main", __name__, cli_group=None)
+
+# Instrumentation served at /metrics (SQLite and BOM metrics live in db.py and bom.py)
+REQUEST_SECONDS = Histogram("heat_http_request_seconds", "Time to handle a request, up to the response headers.",
+                            ["route", "method"])
+REQUESTS = Counter("heat_http_requests_total", "Requests handled, by route and status code.",
+                   ["route", "method", "status"])
+READINGS_STORED = Counter("heat_readings_stored_total", "Readings committed to readings.db (rate() gives rows/sec).")
+READINGS_DUPLICATE = Counter("heat_readings_duplicate_total", "Readings skipped because they were already stored.")
+JOB_SECONDS = Histogram("heat_job_seconds", "Scheduler job run time.", ["job"])
+JOB_FAILURES = Counter("heat_job_failures_total", "Scheduler job runs that raised an exception.", ["job"])
+JOB_MISFIRES = Counter("heat_job_misfires_total", "Scheduler job runs skipped because they started too late.", ["job"])
+WRITE_BEHIND_DEPTH = Gauge("heat_write_behind_depth", "Readings waiting in the write-behind queue.")
+WRITE_BEHIND_DROPPED = Gauge("heat_write_behind_dropped", "Readings the write-behind writer gave up on.")
+PAGE_CACHE = Counter("heat_page_cache_total", "Conditional page requests, by outcome (not_modified, hit, miss, bypass).",
+                     ["page", "result"])
+READINGS_ARCHIVED = Counter("heat_readings_archived_total", "Readings moved from readings.db into archive files.")
+ALERTS_RAISED = Counter("heat_alerts_total", "Confirmed alert level transitions, by new level.", ["level"])
+STARTUP_SECONDS = Gauge("heat_startup_seconds", "Time create_app() took to get ready to serve.")
+SCHEDULER_LEADER = Gauge("heat_scheduler_leader", "1 while this process holds the scheduler lease and runs the jobs.")
 
 # CREATE DATABASES AND TABLES
 def init_databases():
-    if not os.path.exists(DB_PATH):
-        with sqlite3.connect(DB_PATH) as conn:
+    # Returns False when readings.db still has the legacy layout and needs `flask migrate-timestamps` first
+    if not os.path.exists(DATABASES["users"]):
+        with get_db("users") as conn:
             conn.execute('''
                 CREATE TABLE users (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -34,23 +129,28 @@ def init_databases():
                 );
             ''')
 
-    # Initialize readings.db
-    if not os.path.exists("readings.db"):
-        with sqlite3.connect("readings.db") as conn:
-            conn.execute('''
-                CREATE TABLE readings (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    timestamp TEXT NOT NULL,
-                    source TEXT CHECK(source IN ('inside','outside')) NOT NULL,
-                    temperature REAL NOT NULL,
-                    humidity REAL NOT NULL,
-                    apparent REAL NOT NULL
-                );
-            ''')
+    # Initialize readings.db (integer epoch-ms timestamps and source ids; see timestamps.py)
+    with get_db("readings") as conn:
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(readings)")]
+        if not columns:
+            conn.execute(READINGS_SCHEMA.format(name="readings"))
+            conn.execute(READINGS_INDEX)
+
+    # Older files store ISO text timestamps and text sources. Converting a large one takes minutes, too long
+    # for worker startup, so it is left to the migrate-timestamps command
+    migrated = "timestamp" not in columns
+    if migrated:
+        # Minute/hour/day rollup tables, kept current by a trigger on every insert
+        with get_db("readings") as conn:
+            init_rollups(conn)
+
+        # Alert transitions and per-shift exposure totals written by the alert engine
+        with get_db("readings") as conn:
+            init_alerts(conn)
 
     # CREATE settings.db WITH THRESHOLDS TABLE
-    if not os.path.exists("settings.db"):
-        with sqlite3.connect("settings.db") as conn:
+    if not os.path.exists(DATABASES["settings"]):
+        with get_db("settings") as conn:
             # Create thresholds table
             conn.execute('''
                 CREATE TABLE thresholds (
@@ -64,12 +164,7 @@ def init_databases():
             conn.executemany('''
                 INSERT INTO thresholds (temperature_from, temperature_to, threshold_level)
                 VALUES (?, ?, ?)
-            ''', [
-                (18, 26, 'Safe'),
-                (26, 30, 'Moderate Risk'),
-                (30, 35, 'High Risk'),
-                (35, 100, 'Very High Risk')
-            ])
+            ''', DEFAULT_BANDS)
 
             # Create settings table (if you need it)
             conn.execute('''
@@ -86,7 +181,7 @@ def init_databases():
             ''', (datetime.now().isoformat(),))
     else:
         # If settings.db exists but thresholds table doesn't
-        with sqlite3.connect("settings.db") as conn:
+        with get_db("settings") as conn:
             # Check if thresholds table exists
             table_exists = conn.execute('''
                 SELECT count(*) FROM sqlite_master 
@@ -107,16 +202,21 @@ def init_databases():
                 conn.executemany('''
                     INSERT INTO thresholds (temperature_from, temperature_to, threshold_level)
                     VALUES (?, ?, ?)
-                ''', [
-                    (18, 26, 'Safe'),
-                    (26, 30, 'Moderate Risk'),
-                    (30, 35, 'High Risk'),
-                    (35, 100, 'Very High Risk')
-                ])
+                ''', DEFAULT_BANDS)
+
+    # Scheduler leader election between processes (see leader.py)
+    with get_db("leases") as conn:
+        init_leases(conn)
+    return migrated
+
 
+# Largest number of readings accepted in one batch request
+MAX_BATCH_SIZE = 1000
 
-# Call the initialization function at startup
-init_databases()
+# Plausible inside temperatures (°C); anything outside is a faulty sensor, and huge values would
+# overflow the apparent temperature formula
+TEMPERATURE_MIN = -50.0
+TEMPERATURE_MAX = 80.0
 
 # REGEX FOR PASSWORD VALIDATION
 PASSWORD_REGEX = re.compile(
@@ -124,12 +224,12 @@ PASSWORD_REGEX = re.compile(
 )
 
 # ROUTES
-@app.route("/")
+@bp.route("/")
 def index():
     return redirect("/signin")
 
 # Route for handling the sign-in page
-@app.route("/signin", methods=["GET", "POST"])
+@bp.route("/signin", methods=["GET", "POST"])
 def signin():
     # Handle form submission
     if request.method == "POST":
@@ -140,8 +240,8 @@ def signin():
         if not email or not password:
             flash("Both fields are required.", "danger")  # Show error message
             return render_template("signin.html", form=request.form)  # Keep user's input
-        # Connect to the SQLite database
-        with sqlite3.connect(DB_PATH) as conn:
+        # Use the pooled connection to the users database
+        with get_db("users") as conn:
             # Query the user with the given email
             user = conn.execute("SELECT * FROM users WHERE email = ?", (email,)).fetchone()
         # If no user found with the given email
@@ -157,6 +257,7 @@ def signin():
         # If credentials are valid, store session variables
         session["user_id"] = user[0]      # Store user's ID
         session["username"] = user[3]     # Store user's username
+        session["role"] = user[6]         # Store user's role (pages are cached per role)
         flash(f"Welcome back, {user[1]}!", "success")  # Show welcome message using first name
         # Redirect to main application page
         return redirect("/dashboard")
@@ -166,145 +267,373 @@ def signin():
 
 
 # Route for logging the user out
-@app.route("/logout")
+@bp.route("/logout")
 def logout():
     session.clear()  # Clears all session data (user_id, username, etc.)
     flash("Logged out successfully.", "success")  # Display logout message
     return redirect("/signin")  # Redirect to the sign-in page
 
 
-# Route to ingest weather data from BOM for "outside" source
-@app.route("/ingest/outside", methods=["POST"])
+# Route to ingest weather data from every registered BOM station for "outside" source
+@bp.route("/ingest/outside", methods=["POST"])
 def ingest_outside():
-    try:
-        # URL to fetch BOM JSON weather data for a specific station
-        url = "http://reg.bom.gov.au/fwo/IDQ60901/IDQ60901.94576.json"
-        response = requests.get(url, timeout=10)  # Make a GET request with 10s timeout
-        response.raise_for_status()  # Raise exception for HTTP errors
-        bom_data = response.json()  # Parse the response as JSON
-    except Exception as e:
-        # Catch network or JSON parsing errors
-        return jsonify({"error": f"Failed to fetch BOM data: {str(e)}"}), 500
-    try:
-        # Access the latest observation (first item in data array)
-        latest = bom_data["observations"]["data"][0]
-        temp = float(latest["air_temp"])             # Current air temperature
-        rh = float(latest["rel_hum"])                # Relative humidity
-        ts_raw = latest["local_date_time_full"]      # Raw timestamp string (e.g., 20250711143000)
-        # Convert raw timestamp to ISO 8601 format (e.g., "2025-07-11T14:30:00")
-        timestamp = datetime.strptime(ts_raw, "%Y%m%d%H%M%S").isoformat()
-    except (KeyError, ValueError, IndexError) as e:
-        # Catch missing fields or formatting issues
-        return jsonify({"error": f"Invalid BOM data structure: {str(e)}"}), 500
-    # Compute apparent temperature using custom formula
-    apparent = calc_apparent(temp, rh)
-    # Store data into SQLite database if the timestamp doesn't already exist
-    with sqlite3.connect("readings.db") as conn:
-        # Check if this exact timestamp already exists for 'outside'
-        exists = conn.execute('''
-            SELECT 1 FROM readings 
-            WHERE timestamp = ? AND source = 'outside'
-        ''', (timestamp,)).fetchone()
-        if not exists:
-            # Insert the new reading into the database
-            conn.execute('''
-                INSERT INTO readings (timestamp, source, temperature, humidity, apparent)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (timestamp, "outside", temp, rh, apparent))
-            message = "New external data ingested"
-        else:
-            # Skip insertion if data already exists
-            message = "Data already exists (not stored)"
-    # Return a JSON response with summary
+    # Fetch all stations in parallel; only observations newer than each station's last stored one are written
+    results = current_app.extensions["bom_poller"].poll()
+    stored = sum(result.stored for result in results)
+    if stored:
+        message = "New external data ingested"
+    elif all(result.status == "error" for result in results):
+        # Every station failed (network, HTTP or data format errors)
+        return jsonify({
+            "error": "; ".join(result.error for result in results),
+            "stations": [result._asdict() for result in results]
+        }), 500
+    else:
+        # Skip insertion if data already exists
+        message = "Data already exists (not stored)"
+    # Return a JSON response with a summary per station
     return jsonify({
         "message": message,
-        "timestamp": timestamp,
-        "temperature": temp,
-        "humidity": rh,
-        "apparent": apparent
+        "stored": stored,
+        "stations": [result._asdict() for result in results]
     }), 201
 
+def session_role():
+    # Role of the signed-in user (None when signed out); looked up once for sessions from before roles were stored
+    if "user_id" not in session:
+        return None
+    if "role" not in session:
+        row = get_db("users").execute("SELECT role FROM users WHERE id = ?", (session["user_id"],)).fetchone()
+        session["role"] = row[0] if row else None
+    return session["role"]
+
+
+def conditional_page(view):
+    """
+    Serves a GET page by data version: the ETag covers the readings version, the
+    threshold bands, whether the visitor is signed in (the nav bar depends on it even
+    when the role is unknown), the session role and the query string, so a client whose
+    copy is current gets a 304 without the view running, and other clients get the
+    rendered body from the page cache until the data changes. Pages with flash messages
+    pending are always rendered, since those are shown once.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        page = request.endpoint
+        if request.method != "GET" or "_flashes" in session:
+            PAGE_CACHE.labels(page, "bypass").inc()
+            return view(*args, **kwargs)
+        # Read the versions before rendering, so a body is never cached under a newer key than its data
+        key = (page, request.query_string, readings_version.value, thresholds_version(get_thresholds()),
+               "user_id" in session, session_role())
+        etag = page_etag(key)
+        if request.if_none_match.contains_weak(etag):
+            PAGE_CACHE.labels(page, "not_modified").inc()
+            response = Response(status=304)
+        else:
+            body = page_cache.get(key)
+            if body is not None:
+                PAGE_CACHE.labels(page, "hit").inc()
+                response = Response(body, mimetype="text/html")
+            else:
+                PAGE_CACHE.labels(page, "miss").inc()
+                response = current_app.make_response(view(*args, **kwargs))
+                if response.status_code != 200 or "_flashes" in session:
+                    return response
+                page_cache.put(key, response.get_data())
+        response.set_etag(etag, weak=True)
+        # Per-user pages: browsers may keep them but must revalidate; shared caches must not
+        response.headers["Cache-Control"] = "private, no-cache"
+        response.vary.add("Cookie")
+        return response
+    return wrapper
+
+
 # Route for displaying the dashboard page
-@app.route("/dashboard")
+@bp.route("/dashboard")
+@conditional_page
 def dashboard():
-    # Connect to readings database and fetch the latest "inside" reading
-    with sqlite3.connect("readings.db") as conn:
-        inside = conn.execute('''
-            SELECT timestamp, temperature, humidity, apparent
-            FROM readings
-            WHERE source = 'inside'
-            ORDER BY timestamp DESC
-            LIMIT 1
-        ''').fetchone()
-
-        # Fetch the latest "outside" reading
-        outside = conn.execute('''
-            SELECT timestamp, temperature, humidity, apparent
-            FROM readings
-            WHERE source = 'outside'
-            ORDER BY timestamp DESC
-            LIMIT 1
-        ''').fetchone()
-
-    # Get the maximum safe apparent temperature from thresholds table
-    threshold = get_threshold()
-
-    # Logic to determine if an alert should be shown
-    alert = None
-    if inside and inside[3] > threshold:
-        # inside[3] is the apparent temperature
-        alert = "⚠️ Internal Apparent Temperature is above safe threshold!"
-    elif outside and outside[3] > threshold:
-        alert = "⚠️ External Apparent Temperature is above safe threshold!"
-    else:
-        alert = "✅ No critical warning or alert at this point."
+    # Latest inside and outside readings, and the alert they raise
+    inside, outside = latest_readings()
+    levels = get_thresholds()
+    alert = build_alert(inside, outside, levels)
+
+    # Risk level shown on each card
+    inside_level = levels.classify(inside[3]).label if inside else None
+    outside_level = levels.classify(outside[3]).label if outside else None
+
+    # Trend and projected band crossing per source, from the in-memory streaming statistics
+    inside_forecast = stats.summary("inside", levels)
+    outside_forecast = stats.summary("outside", levels)
 
     # Render dashboard template with latest readings and alert message
-    return render_template("dashboard.html", inside=inside, outside=outside, alert=alert)
+    return render_template("dashboard.html", inside=inside, outside=outside, alert=alert,
+                           inside_level=inside_level, outside_level=outside_level,
+                           inside_forecast=inside_forecast, outside_forecast=outside_forecast,
+                           describe_forecast=describe_forecast)
 
 
-# Helper function to get the "safe" temperature threshold
+def latest_readings():
+    # Newest (timestamp, temperature, humidity, apparent) reading for each source, or None,
+    # served from the in-memory recent-readings buffers
+    return recent.latest("inside"), recent.latest("outside")
+
+
+def build_alert(inside, outside, levels):
+    # Alert message for the latest readings against the compiled threshold bands
+    if inside and levels.exceeds_safe(inside[3]):
+        # inside[3] is the apparent temperature
+        return "⚠️ Internal Apparent Temperature is above safe threshold!"
+    elif outside and levels.exceeds_safe(outside[3]):
+        return "⚠️ External Apparent Temperature is above safe threshold!"
+    else:
+        return "✅ No critical warning or alert at this point."
+
+
+# Last alert pushed to /stream clients, so only changes are published
+_last_alert = None
+
+
+def fresh_rows(rows):
+    # Only rows newer than what the recent buffers already show are news for live dashboards
+    # (not late ones, e.g. a gateway flushing an hour of buffered samples)
+    newest = {source: recent.latest(source) for source in SOURCE_IDS}
+    return [row for row in rows if newest[row[1]] is None or row[0] > newest[row[1]].timestamp]
+
+
+def publish_readings(rows):
+    # Push the newest of just-stored (ts, source, temperature, humidity, apparent, device_id)
+    # rows per source to /stream clients, plus the alert message whenever it changes
+    global _last_alert
+    if not broker.has_subscribers():
+        _last_alert = None
+        return
+
+    newest = {}
+    for row in rows:
+        if row[1] not in newest or row[0] > newest[row[1]][0]:
+            newest[row[1]] = row
+
+    levels = get_thresholds()
+    for source, (ts, _, temp, rh, apparent, device_id) in newest.items():
+        forecast = stats.summary(source, levels)
+        broker.publish("reading", {
+            "source": source,
+            "device_id": device_id,
+            "timestamp": ts,
+            "time": format_time(ts),
+            "temperature": temp,
+            "humidity": rh,
+            "apparent": apparent,
+            "level": levels.classify(apparent).label,
+            "above_safe": levels.exceeds_safe(apparent),
+            "trend": forecast["trend_per_10_min"] if forecast else None,
+            "forecast": describe_forecast(forecast),
+        })
+    publish_alert(levels)
+
+
+def publish_alert(levels):
+    # Push the current alert message to /stream clients if it differs from the last one sent
+    global _last_alert
+    alert = build_alert(*latest_readings(), levels)
+    if alert != _last_alert:
+        _last_alert = alert
+        broker.publish("alert", {"message": alert, "danger": "above safe threshold" in alert})
+
+
+# Route streaming new readings and alert changes to open dashboards (Server-Sent Events)
+@bp.route("/stream")
+def stream():
+    return Response(broker.stream(), mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",  # Stop reverse proxies from buffering the stream
+    })
+
+
+# Helper function to get the "safe" temperature threshold (served from the in-memory threshold cache)
 def get_threshold():
-    with sqlite3.connect("settings.db") as conn:
-        cursor = conn.execute('''
-            SELECT temperature_from, temperature_to, threshold_level
-            FROM thresholds
-            ORDER BY temperature_from ASC
-        ''')
-        thresholds = cursor.fetchall()
-    # Find and return the upper bound (temperature_to) for the "safe" range
-    for row in thresholds:
-        if row[2].lower() == "safe":  # threshold_level
-            return row[1]  # Return temperature_to as the upper safe limit
-
-    # Default fallback threshold if "Safe" is not found
-    return 26
-
-@app.route("/temperature-log")
+    return get_thresholds().safe_limit
+
+@bp.route("/temperature-log")
+@conditional_page
 def temperature_log():
-    with sqlite3.connect("readings.db") as conn:
-        # Enable dictionary-style access for rows (e.g., row['temperature'])
-        conn.row_factory = sqlite3.Row
-        # Query the 50 most recent internal (inside) readings
-        internal = conn.execute('''
-            SELECT timestamp, temperature, humidity, apparent
-            FROM readings
-            WHERE source = 'inside'
-            ORDER BY timestamp DESC
-            LIMIT 50
-        ''').fetchall()
-        # Query the 50 most recent external (outside) readings
-        external = conn.execute('''
-            SELECT timestamp, temperature, humidity, apparent
-            FROM readings
-            WHERE source = 'outside'
-            ORDER BY timestamp DESC
-            LIMIT 50
-        ''').fetchall()
+    # The 50 most recent internal and external readings, served from memory
+    internal = recent.newest("inside", 50)
+    external = recent.newest("outside", 50)
+    # Classify every internal row against the current bands in one vectorized call
+    labels = get_thresholds().labels_for([row.apparent for row in internal])
+    internal = list(zip(internal, [level_style(label) for label in labels]))
+
+    # Optional longer-term history from the rollup tables (?start=...&end=...&source=...)
+    history = None
+    if request.args.get("start"):
+        try:
+            history = history_page(request.args)
+        except ValueError as e:
+            flash(str(e), "danger")
+
     # Pass both datasets to the temperature_log.html template for display
-    return render_template("temperature_log.html", internal=internal, external=external)
+    return render_template("temperature_log.html", internal=internal, external=external, history=history)
+
+
+# Route returning min/max/mean buckets for a time range (?source=&start=&end=&cursor=&limit=)
+@bp.route("/api/history")
+def api_history():
+    try:
+        history = history_page(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    history["rows"] = [dict(row) for row in history["rows"]]
+    return jsonify(history)
+
+
+# Route returning the streaming statistics of every sensor (EWMA, window min/max, trend, projected
+# band crossings) plus the per-source dashboard summary; served from memory without touching SQLite
+@bp.route("/api/stats")
+def api_stats():
+    levels = get_thresholds()
+    return jsonify({
+        "sensors": stats.snapshot(levels),
+        "sources": {source: stats.summary(source, levels) for source in SOURCE_IDS},
+    })
+
+
+# Route listing recent alert level transitions, newest first (?limit=&source=&device_id=)
+@bp.route("/api/alerts")
+def api_alerts():
+    try:
+        limit = min(int(request.args.get("limit", 100)), 1000)
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+    conditions, params = [], []
+    if request.args.get("source") in SOURCE_IDS:
+        conditions.append("source_id = ?")
+        params.append(SOURCE_IDS[request.args["source"]])
+    if request.args.get("device_id"):
+        conditions.append("device_id = ?")
+        params.append(request.args["device_id"])
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    rows = get_db("readings").execute(f'''
+        SELECT ts, source_id, device_id, previous, level, apparent
+        FROM alerts {where}
+        ORDER BY ts DESC
+        LIMIT ?
+    ''', (*params, limit)).fetchall()
+    return jsonify([
+        {"timestamp": format_iso(ts), "ts": ts, "source": SOURCE_NAMES[source_id], "device_id": device_id,
+         "previous": previous, "level": level, "apparent": apparent}
+        for ts, source_id, device_id, previous, level, apparent in rows
+    ])
+
+
+# Route returning exposure minutes per risk level for each sensor and shift in a range (?start=&end=)
+@bp.route("/api/exposure")
+def api_exposure():
+    try:
+        start, end = parse_range(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    rows = get_db("readings").execute('''
+        SELECT shift_start, shift, source_id, device_id, level, seconds
+        FROM exposure
+        WHERE shift_start >= ? AND shift_start < ?
+        ORDER BY shift_start, source_id, device_id, level
+    ''', (to_ms(start), to_ms(end))).fetchall()
+    shifts = {}
+    for shift_start, shift, source_id, device_id, level, seconds in rows:
+        entry = shifts.setdefault((shift_start, source_id, device_id), {
+            "shift": shift, "shift_start": format_iso(shift_start), "source": SOURCE_NAMES[source_id],
+            "device_id": device_id, "minutes": {},
+        })
+        entry["minutes"][level] = round(seconds / 60, 1)
+    return jsonify(list(shifts.values()))
+
+
+def _aware(moment):
+    # Naive date-times are local time; give them the local offset so they compare with aware ones
+    return moment if moment.tzinfo is not None else moment.astimezone()
+
+
+def parse_range(args):
+    # (start, end) aware datetimes from ?start=&end= (ISO 8601, naive = local time); defaults to the last 24 hours
+    try:
+        end = _aware(datetime.fromisoformat(args["end"])) if args.get("end") else datetime.now().astimezone()
+        start = _aware(datetime.fromisoformat(args["start"])) if args.get("start") else end - timedelta(days=1)
+    except (ValueError, OverflowError):
+        raise ValueError("start and end must be ISO 8601 date-times")
+    if start >= end:
+        raise ValueError("start must be before end")
+    return start, end
+
 
-@app.route("/signup", methods=["GET", "POST"])
+def history_page(args):
+    """
+    Parses range query arguments and returns one page of rollup buckets, using the
+    coarsest granularity that still fits the range (see rollups.pick_granularity).
+    Raises ValueError with a client-facing message for bad arguments.
+    """
+    source = args.get("source", "inside")
+    if source not in ("inside", "outside"):
+        raise ValueError("source must be 'inside' or 'outside'")
+    start, end = parse_range(args)
+    try:
+        limit = min(int(args.get("limit", DEFAULT_PAGE_SIZE)), MAX_PAGE_SIZE)
+    except ValueError:
+        raise ValueError("limit must be an integer")
+    if limit < 1:
+        raise ValueError("limit must be at least 1")
+
+    granularity = args.get("granularity") or pick_granularity(start, end)
+    if granularity not in GRANULARITIES:
+        raise ValueError("granularity must be minute, hour or day")
+    try:
+        cursor = int(args["cursor"]) if args.get("cursor") else None
+    except ValueError:
+        raise ValueError("cursor must be an integer")
+    rows, next_cursor = query_rollups(source, to_ms(start), to_ms(end), granularity, cursor, limit)
+    return {
+        "source": source,
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "granularity": granularity,
+        "rows": rows,
+        "next_cursor": next_cursor,
+    }
+
+
+# Route streaming raw readings for a time range as CSV or NDJSON
+# (?source=inside|outside|all&start=&end=&format=csv|ndjson&gzip=1)
+@bp.route("/export/readings")
+def export_readings():
+    source = request.args.get("source", "all")
+    if source not in ("inside", "outside", "all"):
+        return jsonify({"error": "source must be 'inside', 'outside' or 'all'"}), 400
+    fmt = request.args.get("format", "csv")
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({"error": "format must be 'csv' or 'ndjson'"}), 400
+    try:
+        start, end = parse_range(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    compress = request.args.get("gzip", "").lower() in ("1", "true", "yes")
+
+    sources = ("inside", "outside") if source == "all" else (source,)
+    mimetype, extension = EXPORT_FORMATS[fmt]
+    filename = f"readings-{source}-{start:%Y%m%d%H%M}-{end:%Y%m%d%H%M}.{extension}"
+    if compress:
+        mimetype, filename = "application/gzip", filename + ".gz"
+
+    # The generator runs after this function returns; stream_with_context keeps the
+    # app context (and its pooled readings connection) alive until the last chunk
+    body = stream_with_context(export_stream(sources, to_ms(start), to_ms(end), fmt, compress,
+                                             archive=current_app.extensions["archive"]))
+    return Response(body, mimetype=mimetype, headers={
+        "Content-Disposition": f'attachment; filename="{filename}"',
+        "X-Accel-Buffering": "no",  # Let reverse proxies pass chunks through as they are produced
+    })
+
+@bp.route("/signup", methods=["GET", "POST"])
 def signup():
     if request.method == "POST":
         fname = request.form.get("firstname", "").strip()
@@ -327,7 +656,7 @@ def signup():
         if role not in ["worker", "manager", "supervisor"]:
             errors.append("Invalid role selected.")
         # Check for existing user with the same username or email
-        with sqlite3.connect(DB_PATH) as conn:
+        with get_db("users") as conn:
             existing_user = conn.execute(
                 "SELECT * FROM users WHERE username = ? OR email = ?", (username, email)
             ).fetchone()
@@ -338,7 +667,7 @@ def signup():
                 flash(e, "danger")
             return render_template("signup.html", form={**request.form})
         hashed_pw = generate_password_hash(password)
-        with sqlite3.connect(DB_PATH) as conn:
+        with get_db("users") as conn:
             conn.execute(
                 "INSERT INTO users (firstname, lastname, username, email, password, role) VALUES (?, ?, ?, ?, ?, ?)",
                 (fname, lname, username, email, hashed_pw, role)
@@ -348,7 +677,7 @@ def signup():
     return render_template("signup.html", form={})
 
 
-@app.route("/simulate/internal", methods=["POST"])
+@bp.route("/simulate/internal", methods=["POST"])
 def simulate_internal():
     # Simulate a base internal temperature (e.g., factory environment)
     base_temp = random.uniform(28.0, 35.0)  # base temperature range in °C
@@ -361,36 +690,32 @@ def simulate_internal():
     # Calculate apparent temperature using a helper function
     apparent = calc_apparent(temp, humidity)
 
-    # Generate a current timestamp in ISO 8601 format (e.g., "2025-07-11T15:35:22")
-    timestamp = datetime.now().isoformat()
+    # Current time in epoch milliseconds
+    ts = now_ms()
 
     # Store the simulated reading into the database as an "inside" source
-    with sqlite3.connect("readings.db") as conn:
-        conn.execute('''
-            INSERT INTO readings (timestamp, source, temperature, humidity, apparent)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (timestamp, "inside", temp, humidity, apparent))
+    queued = store_readings([(ts, "inside", temp, humidity, apparent, "")]) is None
 
     # Return a JSON response confirming the simulation and showing the values
     return jsonify({
         "message": "Simulated internal data added",
-        "timestamp": timestamp,
+        "timestamp": format_iso(ts),
         "temperature": temp,
         "humidity": humidity,
         "apparent": apparent
-    }), 201  # HTTP 201 Created
+    }), 202 if queued else 201  # HTTP 202 Accepted when left to the write-behind queue
 
-@app.route("/threshold", methods=["GET", "POST"])
+@bp.route("/threshold", methods=["GET", "POST"])
+@conditional_page
 def threshold_page():
-    user_role = None
-    if "user_id" in session:
-        with sqlite3.connect(DB_PATH) as conn:
-            cursor = conn.execute("SELECT role FROM users WHERE id = ?", (session["user_id"],))
-            row = cursor.fetchone()
-            if row:
-                user_role = row[0]
+    # The role kept in the session decides what the page shows; changes are checked against users.db
+    user_role = session_role()
     # Handle POST only if user is manager or supervisor
     if request.method == "POST":
+        if "user_id" in session:
+            with get_db("users") as conn:
+                row = conn.execute("SELECT role FROM users WHERE id = ?", (session["user_id"],)).fetchone()
+            user_role = session["role"] = row[0] if row else None
         if user_role not in ("supervisor", "manager"):
             flash("You do not have permission to update thresholds.", "danger")
             return redirect("/threshold")
@@ -409,12 +734,16 @@ def threshold_page():
                     return redirect("/threshold")
                 thresholds.append({"from": t_from, "to": t_to, "label": label})
                 previous_to = t_to
-            with sqlite3.connect("settings.db") as conn:
+            with get_db("settings") as conn:
                 conn.execute("DELETE FROM thresholds")
                 conn.executemany('''
                     INSERT INTO thresholds (temperature_from, temperature_to, threshold_level)
                     VALUES (?, ?, ?)
                 ''', [(t["from"], t["to"], t["label"]) for t in thresholds])
+            # Make this process pick up the new bands immediately
+            invalidate_thresholds()
+            if broker.has_subscribers():
+                publish_alert(get_thresholds())
             flash("Thresholds updated successfully!", "success")
         except ValueError:
             flash("Please enter valid temperature values", "danger")
@@ -422,34 +751,13 @@ def threshold_page():
 
     # If GET or after POST, fetch current thresholds
     try:
-        with sqlite3.connect("settings.db") as conn:
-            conn.row_factory = sqlite3.Row
-            thresholds = conn.execute('''
-                SELECT temperature_from as "from", temperature_to as "to", threshold_level as "label"
-                FROM thresholds
-                ORDER BY temperature_from ASC
-            ''').fetchall()
-
-            if not thresholds:
-                thresholds = [
-                    {"from": 18, "to": 26, "label": "Safe"},
-                    {"from": 26, "to": 30, "label": "Moderate Risk"},
-                    {"from": 30, "to": 35, "label": "High Risk"},
-                    {"from": 35, "to": 100, "label": "Very High Risk"}
-                ]
-
-        return render_template("threshold.html", thresholds=thresholds, user_role=user_role)
-
+        thresholds = get_thresholds().as_rows()
     except sqlite3.OperationalError:
-        return render_template("threshold.html", thresholds=[
-            {"from": 18, "to": 26, "label": "Safe"},
-            {"from": 26, "to": 30, "label": "Moderate Risk"},
-            {"from": 30, "to": 35, "label": "High Risk"},
-            {"from": 35, "to": 100, "label": "Very High Risk"}
-        ], user_role=user_role)
+        thresholds = Thresholds.from_bands(DEFAULT_BANDS).as_rows()
+    return render_template("threshold.html", thresholds=thresholds, user_role=user_role)
 
 
-@app.route("/threshold", methods=["POST"])
+@bp.route("/threshold", methods=["POST"])
 def update_thresholds():
     updated = []
     for i in range(4):
@@ -462,138 +770,779 @@ def update_thresholds():
     return redirect("/threshold")  # Redirect back to the threshold page
 
 
-def calc_apparent(temp: float, rh: float) -> float:
-    """
-    Calculates apparent temperature based on temp (°C) and relative humidity (%),
-    using formula provided in IA3 stimulus.
-    """
-    # Calculate water vapor pressure (rho) using a standard humidity formula
-    rho = (rh / 100.0) * 6.105 * math.exp((17.27 * temp) / (237.7 + temp))
-
-    # Apparent temperature formula: real temp adjusted by humidity effect
-    apparent = temp + 0.33 * rho - 4
-
-    return round(apparent, 1)  # Round to 1 decimal place for display
-
-@app.context_processor
+@bp.app_context_processor
 def utility_processor():
-    def get_threshold_value():
-        # Fetch the "Safe" upper bound from database
-        with sqlite3.connect("settings.db") as conn:
-            cursor = conn.execute('''
-                SELECT temperature_to FROM thresholds 
-                WHERE threshold_level = 'Safe'
-                ORDER BY temperature_from ASC
-                LIMIT 1
-            ''')
-            return cursor.fetchone()[0] if cursor else 26  # Default fallback is 26°C
-
     # Makes get_threshold() available in all Jinja templates
-    return dict(get_threshold=get_threshold_value)
+    return dict(get_threshold=get_threshold)
+
+# Template filters rendering stored epoch-ms timestamps in the server's local time
+bp.app_template_filter("fmt_date")(format_date)
+bp.app_template_filter("fmt_time")(format_time)
+bp.app_template_filter("fmt_datetime")(format_datetime)
 
-@app.route("/ingest/inside", methods=["POST"])
+@bp.route("/ingest/inside", methods=["POST"])
 def ingest_inside():
     # Expect JSON data from the client
-    data = request.get_json()
+    data = request.get_json(silent=True)
 
     # If no JSON provided, return error
-    if not data:
+    if data is None:
         return jsonify({"error": "Missing JSON data"}), 400
 
     try:
-        # Extract temperature and humidity from JSON
-        temp = float(data["temperature"])
-        rh = float(data["humidity"])
-    except (KeyError, ValueError):
-        # Return error if fields are missing or not numeric
-        return jsonify({"error": "Invalid or missing fields"}), 400
+        # Same parsing and checks as a batch item; device_id and timestamp (default now) are optional here
+        device_id, ts, temp, rh = parse_inside_reading(data, reading_window(), anonymous=True)
+    except ValueError as e:
+        # Return error if fields are missing, not numeric or out of range
+        return jsonify({"error": str(e)}), 400
 
     # Calculate apparent temperature based on provided inputs
     apparent = calc_apparent(temp, rh)
 
-    # Use current timestamp for the reading
-    timestamp = datetime.now().isoformat()
-
     # Insert the reading into the 'readings' database under source = 'inside'
-    with sqlite3.connect("readings.db") as conn:
-        conn.execute('''
-            INSERT INTO readings (timestamp, source, temperature, humidity, apparent)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (timestamp, "inside", temp, rh, apparent))
+    queued = store_readings([(ts, "inside", temp, rh, apparent, device_id)]) is None
 
     # Respond with confirmation and inserted values
     return jsonify({
         "message": "Internal data ingested successfully",
-        "timestamp": timestamp,
+        "timestamp": format_iso(ts),
         "temperature": temp,
         "humidity": rh,
         "apparent": apparent
-    }), 201  # HTTP 201 Created
+    }), 202 if queued else 201  # HTTP 202 Accepted when left to the write-behind queue
+
+# Route to ingest many inside readings (e.g. a gateway's buffered samples) in one request
+@bp.route("/ingest/inside/batch", methods=["POST"])
+def ingest_inside_batch():
+    # Binary frames from constrained sensors and gateways (see frames.py)
+    if request.mimetype == "application/octet-stream":
+        return ingest_inside_frame()
+
+    data = request.get_json(silent=True)
+
+    # Accept either a bare JSON array or {"readings": [...]}
+    if isinstance(data, dict):
+        data = data.get("readings")
+    if not isinstance(data, list) or not data:
+        return jsonify({"error": "Expected a non-empty array of readings"}), 400
+    if len(data) > MAX_BATCH_SIZE:
+        return jsonify({"error": f"Batch too large (max {MAX_BATCH_SIZE} readings)"}), 413
+
+    # Validate every reading first, keeping a per-item result for the response
+    results = []
+    valid = []
+    window = reading_window()
+    for index, item in enumerate(data):
+        try:
+            reading = parse_inside_reading(item, window)
+        except ValueError as e:
+            results.append({"index": index, "status": "rejected", "error": str(e)})
+            continue
+        results.append({"index": index, "status": "accepted"})
+        valid.append(reading)
+
+    return batch_response("batch", results, store_inside_readings(valid))
+
+
+def batch_response(kind, results, stored):
+    # Summary shared by JSON batches and frames: counts and a result per item; 201 (or 202 when queued)
+    # if anything was accepted, else 400
+    accepted = sum(result["status"] == "accepted" for result in results)
+    if stored is None:
+        # Queued for the write-behind writer; duplicates are skipped there
+        return jsonify({
+            "message": f"Internal {kind} queued",
+            "accepted": accepted,
+            "rejected": len(results) - accepted,
+            "results": results
+        }), 202 if accepted else 400
+    return jsonify({
+        "message": f"Internal {kind} ingested",
+        "accepted": accepted,
+        "rejected": len(results) - accepted,
+        "duplicates": accepted - stored,
+        "results": results
+    }), 201 if accepted else 400
+
+
+# Route storing one binary frame of inside readings (Content-Type: application/octet-stream)
+def ingest_inside_frame():
+    if (request.content_length or 0) > FRAME_HEADER.size + MAX_FRAME_RECORDS * FRAME_RECORD.size:
+        return jsonify({"error": f"Frame too large (max {MAX_FRAME_RECORDS} records)"}), 413
+    try:
+        results, stored = store_frame(request.get_data(cache=False))
+    except FrameError as e:
+        return jsonify({"error": str(e)}), 400
+    return batch_response("frame", results, stored)
+
+
+def store_frame(data):
+    """
+    Validates and stores one binary frame with the same checks, apparent temperature
+    calculation and storage path as a JSON batch. Returns (a result per record, as in
+    a JSON batch response, and the number stored or None when queued). Raises
+    FrameError for malformed frames, QueueFull when the write-behind queue has no room
+    and BatchTooLarge when the frame holds more readings than the whole queue.
+    """
+    received = now_ms()
+    window = reading_window()
+    valid, results = [], []
+    for index, (device, ts, temp, rh) in enumerate(parse_frame(data)):
+        try:
+            valid.append(validate_inside_reading(decode_device_id(device), ts or received, temp, rh, window))
+        except ValueError as e:
+            results.append({"index": index, "status": "rejected", "error": str(e)})
+            continue
+        results.append({"index": index, "status": "accepted"})
+    return results, store_inside_readings(valid)
+
+
+def frame_handler(app):
+    # FrameListener callback: store a frame received over UDP/TCP and build its ACK
+    def handle(data):
+        with app.app_context():
+            try:
+                results, _ = store_frame(data)
+            except QueueFull:
+                return ACK_BUSY, 0, 0
+            except BatchTooLarge:
+                # Never fits the write-behind queue, so "busy" would only make the sender retry forever
+                return ACK_BAD_FRAME, 0, 0
+        accepted = sum(result["status"] == "accepted" for result in results)
+        return ACK_OK, accepted, len(results) - accepted
+    return handle
+
+
+def store_inside_readings(valid):
+    # Store validated (device_id, ts, temperature, humidity) readings, computing apparent temperature for
+    # all of them in one pass; returns the number stored, or None when queued for the write-behind writer
+    if not valid:
+        return 0
+    apparents = calc_apparent_array([r[2] for r in valid], [r[3] for r in valid]).tolist()
+    # Write every valid reading with a single executemany in one transaction
+    return store_readings([
+        (ts, "inside", temp, rh, apparent, device_id)
+        for (device_id, ts, temp, rh), apparent in zip(valid, apparents)
+    ])
+
+
+def reading_window():
+    # (earliest, latest) epoch ms accepted as a reading's timestamp; worked out once per request or frame
+    config = current_app.config
+    return parse_iso_ms(config["READING_EARLIEST"]), now_ms() + int(config["READING_MAX_FUTURE_SECONDS"] * 1000)
+
+
+def validate_inside_reading(device_id, ts, temp, rh, window, anonymous=False):
+    """
+    Checks shared by every inside ingest format; returns (device_id, ts, temperature,
+    humidity). `window` is reading_window(); `anonymous` allows an empty device_id (the
+    single-reading route predates device ids). Raises ValueError with a client-facing
+    message when the reading is unusable.
+    """
+    if not isinstance(device_id, str) or not (device_id.strip() or anonymous):
+        raise ValueError("Missing device_id")
+    # Comparisons are false for NaN, so this also rejects NaN and infinities
+    if not (TEMPERATURE_MIN <= temp <= TEMPERATURE_MAX and 0 <= rh <= 100):
+        raise ValueError("Temperature or humidity out of range")
+    earliest, latest = window
+    if ts > latest:
+        raise ValueError("Timestamp is in the future")
+    if ts < earliest:
+        raise ValueError(f"Timestamp is before {current_app.config['READING_EARLIEST']}")
+    return device_id.strip(), ts, temp, rh
+
+
+def parse_inside_reading(item, window, anonymous=False):
+    """
+    Validates one JSON reading and returns (device_id, timestamp in epoch ms, temperature, humidity).
+    `window` and `anonymous` are as for validate_inside_reading(). Raises ValueError with a
+    client-facing message when the item is unusable.
+    """
+    if not isinstance(item, dict):
+        raise ValueError("Reading must be a JSON object")
+
+    device_id = item.get("device_id", "" if anonymous else None)
+    if not isinstance(device_id, str) or not (device_id.strip() or anonymous):
+        raise ValueError("Missing device_id")
 
-def load_historical_bom_data():
     try:
-        # BOM JSON feed URL for Brisbane Airport
-        url = "http://reg.bom.gov.au/fwo/IDQ60901/IDQ60901.94576.json"
-        response = requests.get(url, timeout=10)  # Timeout after 10s
-        response.raise_for_status()
-        bom_data = response.json()
-
-        with sqlite3.connect("readings.db") as conn:
-            # Insert last 24 hours of data (assume 48 half-hourly entries)
-            for reading in bom_data["observations"]["data"][:48]:
-                try:
-                    # Extract raw data
-                    temp = float(reading["air_temp"])
-                    rh = float(reading["rel_hum"])
-                    ts_raw = reading["local_date_time_full"]
-
-                    # Convert raw timestamp to ISO format
-                    timestamp = datetime.strptime(ts_raw, "%Y%m%d%H%M%S").isoformat()
-                    apparent = calc_apparent(temp, rh)
-
-                    # Only insert if not already in the DB (prevent duplication)
-                    exists = conn.execute('''
-                        SELECT 1 FROM readings 
-                        WHERE timestamp = ? AND source = 'outside'
-                    ''', (timestamp,)).fetchone()
-
-                    if not exists:
-                        conn.execute('''
-                            INSERT INTO readings (timestamp, source, temperature, humidity, apparent)
-                            VALUES (?, ?, ?, ?, ?)
-                        ''', (timestamp, "outside", temp, rh, apparent))
-
-                except (KeyError, ValueError):
-                    continue  # Skip malformed entries
-
-        print("Loaded historical BOM data successfully")
-
-    except Exception as e:
-        # Print error (used instead of flash/log due to early-stage script execution)
-        print(f"Error loading historical data: {str(e)}")
-
-# Call this once to populate initial data
-load_historical_bom_data()
-
-def simulate_factory_conditions():
+        # float(True) is 1.0; a JSON boolean is never a measurement
+        if isinstance(item["temperature"], bool) or isinstance(item["humidity"], bool):
+            raise TypeError
+        temp = float(item["temperature"])
+        rh = float(item["humidity"])
+    except (KeyError, TypeError, ValueError):
+        raise ValueError("Invalid or missing fields")
+
+    # Sensor timestamp is optional: epoch milliseconds, or ISO 8601 (naive means server-local time)
+    ts_raw = item.get("timestamp")
+    if ts_raw is None:
+        ts = now_ms()
+    elif isinstance(ts_raw, (int, float)) and not isinstance(ts_raw, bool):
+        # Bounded before int(), so 1e30 is this item's error rather than an overflow in the insert
+        if not (math.isfinite(ts_raw) and MIN_MS <= ts_raw <= MAX_MS):
+            raise ValueError("Invalid timestamp")
+        ts = int(ts_raw)
+    else:
+        try:
+            ts = parse_iso_ms(str(ts_raw))
+        except ValueError:
+            raise ValueError("Invalid timestamp")
+
+    return validate_inside_reading(device_id, ts, temp, rh, window, anonymous)
+
+
+def store_readings(rows):
+    """
+    Stores validated readings rows: hands them to the write-behind queue when it is
+    enabled (returns None) or inserts them now (returns the number stored).
+    Raises QueueFull when the queue has no room, BatchTooLarge when it never could.
+    """
+    write_behind = current_app.extensions.get("write_behind")
+    if write_behind is not None:
+        write_behind.submit(rows)
+        return None
+    return insert_readings(rows)
+
+
+@bp.before_app_request
+def refuse_until_migrated():
+    # Every page and API reads or writes readings, which cannot be used in the old layout
+    if current_app.extensions.get("migration_pending") and request.endpoint != "static":
+        return jsonify({"error": "readings.db is being migrated; try again later"}), 503, {"Retry-After": "60"}
+
+
+@bp.app_errorhandler(QueueFull)
+def write_behind_full(e):
+    # Backpressure: ask the sensor or gateway to retry shortly
+    return jsonify({"error": str(e)}), 503, {"Retry-After": "1"}
+
+
+@bp.app_errorhandler(BatchTooLarge)
+def write_behind_too_large(e):
+    # More readings than WRITE_BEHIND_QUEUE_SIZE: a retry would fail the same way, so no Retry-After
+    return jsonify({"error": str(e)}), 413
+
+
+# Route reporting write-behind queue depth and counters
+@bp.route("/ingest/queue")
+def ingest_queue():
+    write_behind = current_app.extensions.get("write_behind")
+    if write_behind is None:
+        return jsonify({"enabled": False})
+    return jsonify({"enabled": True, **write_behind.metrics()})
+
+
+@bp.before_app_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+
+@bp.after_app_request
+def record_request_metrics(response):
+    # Label by URL rule (not the raw path) so the number of series stays bounded
+    started = g.pop("request_started", None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else "<unmatched>"
+        REQUEST_SECONDS.labels(route, request.method).observe(time.perf_counter() - started)
+        REQUESTS.labels(route, request.method, str(response.status_code)).inc()
+    return response
+
+
+# Route exposing every metric in Prometheus text format
+@bp.route("/metrics")
+def metrics():
+    write_behind = current_app.extensions.get("write_behind")
+    if write_behind is not None:
+        queue_stats = write_behind.metrics()
+        WRITE_BEHIND_DEPTH.set(queue_stats["depth"])
+        WRITE_BEHIND_DROPPED.set(queue_stats["dropped"])
+    lease = current_app.extensions.get("scheduler_lease")
+    SCHEDULER_LEADER.set(1 if lease is not None and lease.is_leader else 0)
+    STARTUP_SECONDS.set(current_app.extensions.get("startup_seconds", 0.0))
+    return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
+
+
+def insert_readings(rows):
+    # Insert many (ts, source, temperature, humidity, apparent, device_id) rows in one transaction,
+    # ts in epoch milliseconds and source "inside" or "outside".
+    # Rows already stored for the same source, timestamp and device are skipped, in readings.db or (for
+    # days moved out by retention) the archive files; returns the number stored.
+    archive = current_app.extensions.get("archive")
+    archived = archive.archived([(row[0], SOURCE_IDS[row[1]], row[5]) for row in rows]) if archive else None
+    candidates = [row for row in rows if (row[0], SOURCE_IDS[row[1]], row[5]) not in archived] if archived else rows
+    with get_db("readings") as conn:
+        # rowcount sums the rows inserted per parameter set; unlike total_changes it leaves out
+        # the rollup trigger's writes
+        stored = conn.executemany('''
+            INSERT INTO readings (ts, source_id, temperature, humidity, apparent, device_id)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT DO NOTHING
+        ''', ((ts, SOURCE_IDS[source], temp, rh, apparent, device_id)
+              for ts, source, temp, rh, apparent, device_id in candidates)).rowcount
+        inserted = candidates
+        if stored:
+            newest_id = conn.execute("SELECT max(id) FROM readings").fetchone()[0]
+            if stored < len(candidates):
+                # Some were duplicates: keep the rows actually inserted, which took the last `stored`
+                # ids (this transaction holds the write lock)
+                inserted = [(ts, SOURCE_NAMES[source_id], temp, rh, apparent, device_id)
+                            for ts, source_id, temp, rh, apparent, device_id in conn.execute('''
+                                SELECT ts, source_id, temperature, humidity, apparent, device_id
+                                FROM readings
+                                WHERE id > ?
+                                ORDER BY id
+                            ''', (newest_id - stored,))]
+    READINGS_STORED.inc(stored)
+    READINGS_DUPLICATE.inc(len(rows) - stored)
+    # Update the in-memory recent readings and statistics, and notify live dashboards once the
+    # rows are committed
+    if stored:
+        fresh = fresh_rows(inserted)
+        recent.add_rows(inserted)
+        stats.add_rows(inserted)
+        # Our rows are the newest unless another process stored some since the last catch-up;
+        # then take those in now so the readings version (and every page ETag) stays exact
+        if newest_id - stored == readings_version.value:
+            readings_version.advance(newest_id)
+        else:
+            catch_up_readings()
+        if fresh:
+            publish_readings(fresh)
+        try:
+            evaluate_alerts()
+        except Exception:
+            # The readings are committed either way; the engine picks them up on its next run
+            current_app.logger.exception("Evaluating alerts failed")
+    return stored
+
+
+def evaluate_alerts():
+    """
+    Runs the alert engine over every reading stored since its cursor, by any process.
+    Only one process evaluates alerts: the scheduler leader where processes share the
+    databases, or this one when it has no lease (tests, CLI commands). Rows inserted
+    here are evaluated straight away; the leader's catch-up thread picks up the rest.
+    """
+    engine = current_app.extensions.get("alert_engine")
+    lease = current_app.extensions.get("scheduler_lease")
+    if engine is None or (lease is not None and not lease.is_leader):
+        return
+    alerts = engine.catch_up(get_db("readings"), get_thresholds())
+    for alert in alerts:
+        ALERTS_RAISED.labels(alert.level).inc()
+    engine.notify(alerts)
+
+def load_historical_bom_data():
+    # Backfill every station's feed (up to 72 hours) newer than what is already stored
+    results = current_app.extensions["bom_poller"].poll()
+    for result in results:
+        if result.status == "error":
+            # Runs in a background thread, so log the failure rather than raising
+            current_app.logger.warning("Error loading historical data for station %s: %s",
+                                       result.station, result.error)
+        else:
+            current_app.logger.info("Loaded historical BOM data for station %s (%d new)",
+                                    result.station, result.stored)
+
+
+def poll_bom_stations(app):
+    # Scheduler job: pick up new observations from every station
+    with app.app_context():
+        load_historical_bom_data()
+
+def simulate_factory_conditions(app):
     with app.app_context():
         # Randomly simulate internal environment like a hot factory
         temp = random.uniform(28.0, 38.0)
         humidity = random.uniform(40.0, 65.0)
         apparent = calc_apparent(temp, humidity)
-        timestamp = datetime.now().isoformat()
+        ts = now_ms()
 
         # Insert the simulated reading
-        with sqlite3.connect("readings.db") as conn:
-            conn.execute('''
-                INSERT INTO readings (timestamp, source, temperature, humidity, apparent)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (timestamp, "inside", temp, humidity, apparent))
+        store_readings([(ts, "inside", temp, humidity, apparent, "")])
+
+# CLI: flask --app app recompute-apparent [--chunk-size N] [--restart]
+@bp.cli.command("recompute-apparent")
+@click.option("--chunk-size", default=5000, show_default=True, help="Rows per transaction.")
+@click.option("--restart", is_flag=True, help="Ignore a saved checkpoint and start from the first row.")
+def recompute_apparent_command(chunk_size, restart):
+    """Recompute readings.apparent with the current formula (resumable)."""
+    def report(done, total):
+        click.echo(f"Recomputed {done}/{total} rows")
+
+    changed = recompute_apparent(chunk_size=chunk_size, restart=restart, progress=report)
+    if changed:
+        # Apparent min/max/mean in the rollups were built from the old values (archived days keep theirs)
+        rebuild_rollups(since_ms=current_app.extensions["archive"].archived_until())
+    click.echo(f"Done: {changed} rows updated")
+
+# CLI: flask --app app simulate [--sensors N] [--zones N] [--interval S] [--spike-rate R] [--duration S]
+@bp.cli.command("simulate")
+@click.option("--sensors", default=100, show_default=True, help="Virtual inside sensors.")
+@click.option("--zones", default=4, show_default=True, help="Zones the sensors are spread over.")
+@click.option("--interval", default=5.0, show_default=True, help="Seconds between samples per sensor.")
+@click.option("--spike-rate", default=0.2, show_default=True, help="Heat spikes per sensor per hour.")
+@click.option("--duration", type=float, help="Seconds to run (default: until interrupted).")
+@click.option("--seed", type=int, help="Random seed for a repeatable fleet.")
+def simulate_command(sensors, zones, interval, spike_rate, duration, seed):
+    """Emit readings from a fleet of virtual sensors through the ingest path."""
+    fleet = SensorFleet(sensors, zones, interval, spike_rate, seed=seed)
+    click.echo(f"Simulating {sensors} sensors in {zones} zones, {sensors / interval:.1f} readings/s")
+    stats = _run_with_progress(lambda stop, progress: run_fleet(store_readings, fleet, duration, stop, progress))
+    _flush_write_behind()
+    _echo_run_stats(stats)
+
+
+# CLI: flask --app app replay [--start ISO] [--end ISO] [--source all|inside|outside] [--speed X]
+@bp.cli.command("replay")
+@click.option("--start", help="Start of the history to replay (ISO 8601; default 24 hours before --end).")
+@click.option("--end", help="End of the history to replay (ISO 8601; default now).")
+@click.option("--source", type=click.Choice(["all", "inside", "outside"]), default="all", show_default=True)
+@click.option("--speed", type=click.FloatRange(1, 1000), default=1.0, show_default=True,
+              help="Playback speed, 1x to 1000x real time.")
+@click.option("--device-prefix", default="replay-", show_default=True,
+              help="Prefix for replayed device ids (keeps replayed BOM rows from moving the poller's high-water mark).")
+def replay_command(start, end, source, speed, device_prefix):
+    """Play stored readings back through the ingest path, re-stamped as live data."""
+    try:
+        start, end = parse_range({"start": start, "end": end})
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+    sources = ("inside", "outside") if source == "all" else (source,)
+
+    # Read history on a connection of its own so replayed writes never land in the cursor
+    conn = db.connect("readings")
+    chunks = iter_readings(sources, to_ms(start), to_ms(end), conn=conn, archive=current_app.extensions["archive"])
+    try:
+        stats = _run_with_progress(
+            lambda stop, progress: replay(store_readings, chunks, speed, device_prefix, stop, progress))
+    finally:
+        chunks.close()
+        conn.close()
+    _flush_write_behind()
+    _echo_run_stats(stats)
+
+
+def _run_with_progress(run):
+    # Run a simulator loop with once-a-second progress lines; Ctrl-C stops it cleanly
+    stopping = threading.Event()
+
+    def progress(stats):
+        click.echo(f"{stats.emitted} readings in {stats.seconds:.0f}s "
+                   f"({stats.emitted / max(stats.seconds, 1e-9):.0f}/s, max lag {stats.max_lag:.2f}s)")
+
+    previous = signal.signal(signal.SIGINT, lambda signum, frame: stopping.set())
+    try:
+        return run(stopping.is_set, progress)
+    finally:
+        signal.signal(signal.SIGINT, previous)
+
+
+def _flush_write_behind():
+    write_behind = current_app.extensions.get("write_behind")
+    if write_behind is not None:
+        write_behind.close()
+
+
+def _echo_run_stats(stats):
+    click.echo(f"Done: {stats.emitted} readings in {stats.batches} batches over {stats.seconds:.1f}s "
+               f"({stats.emitted / max(stats.seconds, 1e-9):.0f}/s); {stats.stored} stored directly, "
+               f"max lag {stats.max_lag:.2f}s")
+
+
+# CLI: flask --app app migrate-timestamps [--chunk-size N]
+@bp.cli.command("migrate-timestamps")
+@click.option("--chunk-size", default=10000, show_default=True, help="Rows per transaction.")
+def migrate_timestamps_command(chunk_size):
+    """Convert readings.db to integer timestamps and source ids (resumable)."""
+    with db.init_lock(), get_db("readings") as conn:
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(readings)")]
+        if "timestamp" not in columns:
+            click.echo("readings.db already uses integer timestamps")
+            return
+
+        def report(done, total):
+            click.echo(f"Migrated {done}/{total} rows")
+
+        migrate_readings(conn, LEGACY_STATION_ID, station_zones(current_app.extensions["bom_poller"].stations),
+                         chunk_size=chunk_size, progress=report)
+        init_rollups(conn)
+    click.echo("Done; restart the app to serve the converted readings")
+
+
+def run_retention(days=None, progress=None):
+    # Move readings older than `days` (default RETENTION_DAYS) whole local days into the archive files
+    days = current_app.config["RETENTION_DAYS"] if days is None else days
+    before = day_bounds(now_ms() - days * 86_400_000)[0]
+    run = archive_readings(get_db("readings"), current_app.extensions["archive"], before,
+                           batch_rows=current_app.config["RETENTION_BATCH_ROWS"], progress=progress)
+    READINGS_ARCHIVED.inc(run.rows)
+    return run
+
+
+def apply_retention(app):
+    # Scheduler job: archive readings that have aged past RETENTION_DAYS
+    with app.app_context():
+        run = run_retention()
+        if run.rows:
+            app.logger.info("Archived %d readings from %d days in %.1f s", run.rows, run.days, run.seconds)
+
+
+# CLI: flask --app app archive-readings [--days N]
+@bp.cli.command("archive-readings")
+@click.option("--days", type=click.IntRange(0), help="Keep this many whole days in readings.db (default RETENTION_DAYS).")
+def archive_readings_command(days):
+    """Move old readings from readings.db into per-day archive files."""
+    if days is None and current_app.config["RETENTION_DAYS"] is None:
+        raise click.UsageError("RETENTION_DAYS is not set; pass --days")
+    conn = get_db("readings")
+    if not incremental_vacuum_enabled(conn):
+        # Older files need one full VACUUM before space can be handed back incrementally
+        click.echo("Enabling incremental vacuum on readings.db (one-time full VACUUM)...")
+        enable_incremental_vacuum(conn)
+
+    def report(day_start, rows):
+        click.echo(f"Archived {rows} readings from {format_date(day_start)}")
+
+    run = run_retention(days, progress=report)
+    click.echo(f"Done: {run.rows} readings from {run.days} days archived in {run.seconds:.1f} s "
+               f"to {current_app.extensions['archive'].directory}")
+
+
+def create_app(config=None):
+    """
+    Builds the Flask app: applies configuration, prepares the databases and warms the
+    in-memory buffers. Nothing here touches the network; background work (scheduler,
+    BOM backfill) only starts when START_BACKGROUND is set.
+    """
+    started = time.perf_counter()
+    app = Flask(__name__)
+    app.config.update(DEFAULT_CONFIG)
+    app.config.update(config or {})
+    app.secret_key = app.config["SECRET_KEY"]
+
+    # Pooled, WAL-mode connections shared by every route and job (see db.py)
+    db.init_app(app)
+    app.register_blueprint(bp)
+
+    # Alert engine following the readings table (in the scheduler leader only); its state is saved in readings.db
+    if app.config["ALERTS"]:
+        app.extensions["alert_engine"] = AlertEngine(
+            make_sink(app.config),
+            rules=app.config["ALERT_RULES"],
+            default_rule=AlertRule(app.config["ALERT_HYSTERESIS"], app.config["ALERT_MIN_SECONDS"]),
+            shifts=app.config["SHIFTS"],
+        )
+
+    # Optional write-behind mode: ingest routes queue readings and one writer thread commits them in groups
+    if app.config["WRITE_BEHIND"]:
+        write_behind = WriteBehindQueue(
+            insert_readings,
+            queue_size=app.config["WRITE_BEHIND_QUEUE_SIZE"],
+            batch_size=app.config["WRITE_BEHIND_BATCH_SIZE"],
+            flush_seconds=app.config["WRITE_BEHIND_FLUSH_SECONDS"],
+        )
+        write_behind.start(wrap=app.app_context)
+        # Flush whatever is still queued on a clean shutdown
+        atexit.register(write_behind.close)
+        app.extensions["write_behind"] = write_behind
+
+    # Per-day archive files of readings moved out of readings.db by the retention job
+    app.extensions["archive"] = ArchiveStore(app.config["ARCHIVE_DIR"] or os.path.join(
+        os.path.dirname(os.path.abspath(DATABASES["readings"])), "archive"))
+
+    # Concurrent poller for the configured BOM stations
+    app.extensions["bom_poller"] = BomPoller(load_stations(app.config["BOM_STATIONS"]), insert_readings,
+                                             timeout=app.config["BOM_TIMEOUT"])
+
+    with app.app_context():
+        # Create or migrate the databases (one process at a time), then load the newest readings of each
+        # source into memory
+        with db.init_lock():
+            migrated = init_databases()
+        invalidate_thresholds()
+        page_cache.clear()
+        if migrated:
+            # Catch-up starts from here; rows stored during the warm-up are seen twice, which the buffers ignore
+            readings_version.reset(newest_reading_id())
+            recent.warm()
+            stats.warm()
+            if "alert_engine" in app.extensions:
+                app.extensions["alert_engine"].warm(get_db("readings"), get_thresholds())
+        else:
+            app.extensions["migration_pending"] = True
+            app.logger.warning("readings.db uses the old timestamp layout; requests get 503 until "
+                               "`flask --app app migrate-timestamps` has converted it and the app is restarted")
+
+    if app.config["START_BACKGROUND"] and not app.extensions.get("migration_pending"):
+        start_background(app)
+
+    # Time from create_app() to ready-to-serve, e.g. for startup checks
+    app.extensions["startup_seconds"] = time.perf_counter() - started
+    app.logger.info("App ready in %.1f ms", app.extensions["startup_seconds"] * 1000)
+    return app
+
+
+def timed_job(app, name, func):
+    # Wrap a scheduler job so its run time is recorded and failures are logged instead of lost
+    def run():
+        started = time.perf_counter()
+        try:
+            func(app)
+        except Exception:
+            JOB_FAILURES.labels(name).inc()
+            app.logger.exception("Scheduler job %s failed", name)
+        finally:
+            JOB_SECONDS.labels(name).observe(time.perf_counter() - started)
+    return run
+
+
+def start_background(app):
+    """
+    Background work for a serving process. Every process follows readings stored by the
+    others (catch_up_readings), but only the holder of the scheduler lease runs the
+    scheduled jobs, the BOM backfill and the alert engine, so N workers don't simulate,
+    poll or alert N times.
+    """
+    lease = LeaderLease("scheduler", lease_seconds=app.config["LEADER_LEASE_SECONDS"],
+                        on_elected=lambda: start_scheduler(app), on_demoted=lambda: stop_scheduler(app))
+    app.extensions["scheduler_lease"] = lease
+    lease.start()
+    # Hand the lease over on a clean shutdown (stopping this process's jobs first)
+    atexit.register(lease.stop)
+
+    def follow():
+        while True:
+            time.sleep(app.config["CATCH_UP_SECONDS"])
+            try:
+                with app.app_context():
+                    catch_up_readings()
+                    evaluate_alerts()
+            except Exception:
+                app.logger.exception("Catching up on stored readings failed")
+
+    threading.Thread(target=follow, name="readings-catch-up", daemon=True).start()
+
+
+def newest_reading_id():
+    return get_db("readings").execute("SELECT coalesce(max(id), 0) FROM readings").fetchone()[0]
+
+
+# Serialises catch-up between the follower thread and insert_readings()
+_catch_up_lock = threading.Lock()
+
+
+def catch_up_readings(limit=5000):
+    """
+    Feeds readings stored by any process after the current readings version into this
+    process's recent buffers, statistics and /stream clients, then advances the version.
+    Rows this process stored itself are already in the buffers, which skip them as
+    duplicates. Ids grow in commit order (SQLite has one writer at a time), so nothing
+    is missed.
+    """
+    with _catch_up_lock:
+        while _catch_up_batch(limit) == limit:
+            pass
+
+
+def _catch_up_batch(limit):
+    seen_id = readings_version.value
+    rows = get_db("readings").execute('''
+        SELECT id, ts, source_id, temperature, humidity, apparent, device_id
+        FROM readings
+        WHERE id > ?
+        ORDER BY id
+        LIMIT ?
+    ''', (seen_id, limit)).fetchall()
+    if not rows:
+        return 0
+    readings = [(ts, SOURCE_NAMES[source_id], temp, rh, apparent, device_id)
+                for _, ts, source_id, temp, rh, apparent, device_id in rows]
+    fresh = fresh_rows(readings)
+    recent.add_rows(readings)
+    stats.add_rows(readings)
+    if fresh:
+        publish_readings(fresh)
+    readings_version.advance(rows[-1][0])
+    return len(rows)
+
+
+def start_scheduler(app):
+    # Run the scheduled jobs, the BOM history backfill and any frame listeners in this process
+    # (called once it becomes the leader)
+    scheduler = BackgroundScheduler()
+    scheduler.add_job(timed_job(app, "simulate", simulate_factory_conditions), 'interval', id="simulate",
+                      minutes=app.config["SIMULATE_INTERVAL_MINUTES"])
+    scheduler.add_job(timed_job(app, "poll_bom", poll_bom_stations), 'interval', id="poll_bom",
+                      minutes=app.config["BOM_POLL_MINUTES"])
+    if app.config["RETENTION_DAYS"] is not None:
+        scheduler.add_job(timed_job(app, "retention", apply_retention), 'interval', id="retention",
+                          minutes=app.config["RETENTION_CHECK_MINUTES"])
+    scheduler.add_listener(lambda event: JOB_MISFIRES.labels(event.job_id).inc(), EVENT_JOB_MISSED)
+    scheduler.start()
+    app.extensions["scheduler"] = scheduler
+
+    def backfill():
+        with app.app_context():
+            load_historical_bom_data()
+
+    thread = threading.Thread(target=backfill, name="bom-backfill", daemon=True)
+    thread.start()
+    app.extensions["bom_backfill"] = thread
+
+    if app.config["FRAME_UDP"] or app.config["FRAME_TCP"]:
+        start_frame_listener(app)
+
+
+# Seconds between attempts to bind the frame listener ports while something else holds them
+FRAME_BIND_RETRY_SECONDS = 5
+
+# Serialises handing a bound frame listener to the app with stop_scheduler() taking it away
+_frame_listener_lock = threading.Lock()
+
+
+def start_frame_listener(app):
+    """
+    Binds the frame listeners on a thread of their own, retrying while the ports are
+    taken (e.g. still held by a former leader that has not exited), so a bind failure
+    never holds up the scheduled jobs. stop_scheduler() ends the attempts.
+    """
+    stopping = threading.Event()
+    app.extensions["frame_listener_stopping"] = stopping
+
+    def run():
+        while not stopping.is_set():
+            try:
+                listener = FrameListener(frame_handler(app), udp=app.config["FRAME_UDP"], tcp=app.config["FRAME_TCP"])
+            except OSError as e:
+                app.logger.warning("Frame listener could not bind (%s); retrying in %d s", e, FRAME_BIND_RETRY_SECONDS)
+                stopping.wait(FRAME_BIND_RETRY_SECONDS)
+                continue
+            with _frame_listener_lock:
+                if not stopping.is_set():
+                    app.extensions["frame_listener"] = listener.start()
+                    app.logger.info("Receiving frames on %s", listener.addresses)
+                    return
+            listener.stop()
+            return
+
+    threading.Thread(target=run, name="frames-bind", daemon=True).start()
+
+
+def stop_scheduler(app):
+    # Stop scheduling jobs once the lease is lost or given up; a job already running finishes
+    scheduler = app.extensions.pop("scheduler", None)
+    if scheduler is not None:
+        scheduler.shutdown(wait=False)
+    stopping = app.extensions.pop("frame_listener_stopping", None)
+    if stopping is not None:
+        stopping.set()
+    with _frame_listener_lock:
+        listener = app.extensions.pop("frame_listener", None)
+    if listener is not None:
+        listener.stop()
 
-# Start scheduler
-scheduler = BackgroundScheduler()
-scheduler.add_job(simulate_factory_conditions, 'interval', minutes=5)
-scheduler.start()
 
 if __name__ == "__main__":
-    app.run(debug=True, use_reloader=False)
+    create_app({"START_BACKGROUND": True}).run(debug=True, use_reloader=False)
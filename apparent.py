@@ -0,0 +1,115 @@
+import math
+from datetime import datetime
+
+import numpy as np
+
+from db import get_db
+
+# Rows read and written per transaction by recompute_apparent()
+RECOMPUTE_CHUNK_SIZE = 5000
+
+# Name under which recompute_apparent() records its checkpoint in job_progress
+RECOMPUTE_JOB = "recompute_apparent"
+
+
+def calc_apparent(temp: float, rh: float) -> float:
+    """
+    Calculates apparent temperature based on temp (°C) and relative humidity (%),
+    using formula provided in IA3 stimulus.
+    """
+    # Calculate water vapor pressure (rho) using a standard humidity formula
+    rho = (rh / 100.0) * 6.105 * math.exp((17.27 * temp) / (237.7 + temp))
+
+    # Apparent temperature formula: real temp adjusted by humidity effect
+    apparent = temp + 0.33 * rho - 4
+
+    return round(apparent, 1)  # Round to 1 decimal place for display
+
+
+def calc_apparent_array(temps, rhs):
+    """
+    Array version of calc_apparent: takes array-likes or buffers (NumPy arrays, lists,
+    array.array, memoryview) of temperature and humidity and returns a float64 array.
+    Results are identical to calling calc_apparent on each pair.
+    """
+    temps = np.asarray(temps, dtype=float)
+    rhs = np.asarray(rhs, dtype=float)
+
+    rho = (rhs / 100.0) * 6.105 * np.exp((17.27 * temps) / (237.7 + temps))
+    apparent = temps + 0.33 * rho - 4
+    result = np.round(apparent, 1)
+
+    # np.exp and np.round can differ from math.exp and round() in the last bit, which only
+    # matters when a value sits on a rounding tie; redo those few with the scalar function
+    scaled = apparent * 10
+    near_tie = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+    for i in np.flatnonzero(near_tie):
+        result[i] = calc_apparent(float(temps[i]), float(rhs[i]))
+    return result
+
+
+def recompute_apparent(chunk_size=RECOMPUTE_CHUNK_SIZE, restart=False, progress=None):
+    """
+    Recomputes readings.apparent for every row with the current formula, streaming the
+    table in id order one chunk per transaction. Each chunk commits together with a
+    checkpoint and the count of rows changed so far, so an interrupted run resumes where
+    it stopped. `progress` is called with (rows done, total rows) after every chunk.
+    Returns the number of rows changed, including those changed before a resume.
+    """
+    conn = get_db("readings")
+    with conn:
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS job_progress (
+                name TEXT PRIMARY KEY,
+                last_id INTEGER NOT NULL,
+                changed INTEGER NOT NULL DEFAULT 0,     -- Rows changed by the run so far
+                updated_at TEXT NOT NULL
+            )
+        ''')
+        if "changed" not in {column[1] for column in conn.execute("PRAGMA table_info(job_progress)")}:
+            conn.execute("ALTER TABLE job_progress ADD COLUMN changed INTEGER NOT NULL DEFAULT 0")
+        if restart:
+            conn.execute("DELETE FROM job_progress WHERE name = ?", (RECOMPUTE_JOB,))
+
+    row = conn.execute("SELECT last_id, changed FROM job_progress WHERE name = ?", (RECOMPUTE_JOB,)).fetchone()
+    last_id, changed = row if row else (0, 0)
+    total = conn.execute("SELECT count(*) FROM readings").fetchone()[0]
+    done = conn.execute("SELECT count(*) FROM readings WHERE id <= ?", (last_id,)).fetchone()[0]
+
+    while True:
+        chunk = conn.execute('''
+            SELECT id, temperature, humidity, apparent
+            FROM readings
+            WHERE id > ?
+            ORDER BY id
+            LIMIT ?
+        ''', (last_id, chunk_size)).fetchall()
+        if not chunk:
+            break
+
+        ids, temps, rhs, old = (np.array(column) for column in zip(*chunk))
+        new = calc_apparent_array(temps, rhs)
+        # Only rewrite rows whose value actually changes
+        stale = new != old
+        last_id = int(ids[-1])
+        changed += int(stale.sum())
+
+        with conn:
+            conn.executemany(
+                "UPDATE readings SET apparent = ? WHERE id = ?",
+                zip(new[stale].tolist(), ids[stale].tolist())
+            )
+            conn.execute('''
+                INSERT INTO job_progress (name, last_id, changed, updated_at) VALUES (?, ?, ?, ?)
+                ON CONFLICT (name) DO UPDATE SET
+                    last_id = excluded.last_id, changed = excluded.changed, updated_at = excluded.updated_at
+            ''', (RECOMPUTE_JOB, last_id, changed, datetime.now().isoformat()))
+
+        done += len(chunk)
+        if progress:
+            progress(done, total)
+
+    # Finished: the next run (e.g. after another formula change) starts from the beginning
+    with conn:
+        conn.execute("DELETE FROM job_progress WHERE name = ?", (RECOMPUTE_JOB,))
+    return changed
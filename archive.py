@@ -0,0 +1,345 @@
+import heapq
+import json
+import mmap
+import os
+import re
+import struct
+import time
+from datetime import datetime, timedelta
+from typing import NamedTuple
+
+import numpy as np
+
+from timestamps import SOURCE_IDS, local_datetime, to_ms
+
+# Defaults for the RETENTION_* / ARCHIVE_* settings
+RETENTION_DAYS = 90         # Raw readings older than this (whole local days) move to archive files
+BATCH_ROWS = 5000           # Archived rows deleted from readings.db per transaction
+VACUUM_PAGES = 2000         # Free pages handed back to the file system per incremental vacuum step
+
+MAGIC = b"HEATARC1"
+PREAMBLE = struct.Struct("<8sI")    # magic, header length
+ALIGN = 8                           # Every column starts on an 8-byte boundary so it can be viewed in place
+
+# Column layout of an archive file: 23 bytes per reading, against ~80 for a row plus its index entry in SQLite
+COLUMNS = (
+    ("ts", "<i8"),              # Epoch ms, UTC
+    ("source_id", "u1"),
+    ("device", "<u2"),          # Index into the file's sorted device id list
+    ("temperature", "<f4"),
+    ("humidity", "<f4"),
+    ("apparent", "<f4"),
+)
+# float32 keeps 7 significant digits; values read back are rounded to them (30.1, not 30.100000381)
+SIGNIFICANT_DIGITS = 7
+
+FILE_PATTERN = re.compile(r"^readings-(\d{4})(\d{2})(\d{2})\.col$")
+
+
+class ArchiveRun(NamedTuple):
+    days: int           # Archive files written or extended
+    rows: int           # Readings moved out of readings.db
+    seconds: float
+
+
+def day_bounds(ms):
+    # (start, end) epoch ms of the local day containing `ms`; to_ms() applies each midnight's own UTC offset
+    midnight = local_datetime(ms).replace(hour=0, minute=0, second=0, microsecond=0, tzinfo=None)
+    return to_ms(midnight), to_ms(midnight + timedelta(days=1))
+
+
+def _pad(offset):
+    return -offset % ALIGN
+
+
+def write_day(path, ts, source_id, devices, temperature, humidity, apparent):
+    """
+    Writes one day of readings as an archive file: a JSON header followed by one packed
+    array per column, rows sorted by (ts, source_id, device id) with duplicates dropped.
+    `devices` holds a device id string per row. The file is written beside `path` and
+    renamed over it, so readers see either the old or the new file, never a partial one.
+    """
+    names, device = np.unique(np.asarray(devices, dtype=object).astype(str), return_inverse=True)
+    if len(names) > np.iinfo(np.uint16).max:
+        raise ValueError("Too many devices for one archive day")
+    columns = {"ts": np.asarray(ts), "source_id": np.asarray(source_id), "device": device,
+               "temperature": np.asarray(temperature), "humidity": np.asarray(humidity),
+               "apparent": np.asarray(apparent)}
+    order = np.lexsort((columns["device"], columns["source_id"], columns["ts"]))
+    columns = {name: values[order] for name, values in columns.items()}
+    if len(order):
+        key = np.stack([columns["ts"], columns["source_id"], columns["device"]])
+        keep = np.concatenate(([True], (key[:, 1:] != key[:, :-1]).any(axis=0)))
+        columns = {name: values[keep] for name, values in columns.items()}
+    rows = len(columns["ts"])
+
+    header = {"rows": rows, "devices": names.tolist(), "columns": {}}
+    offset = 0
+    for name, dtype in COLUMNS:
+        header["columns"][name] = [dtype, offset]
+        offset += rows * np.dtype(dtype).itemsize
+        offset += _pad(offset)
+    encoded = json.dumps(header).encode()
+    encoded += b" " * _pad(PREAMBLE.size + len(encoded))
+
+    partial = f"{path}.partial"
+    with open(partial, "wb") as f:
+        f.write(PREAMBLE.pack(MAGIC, len(encoded)))
+        f.write(encoded)
+        for name, dtype in COLUMNS:
+            data = columns[name].astype(dtype).tobytes()
+            f.write(data + b"\0" * _pad(len(data)))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(partial, path)
+    return rows
+
+
+def _significant(values):
+    # float32 values as float64 rounded to SIGNIFICANT_DIGITS, so they print as the stored decimals did
+    values = values.astype(np.float64)
+    magnitude = np.floor(np.log10(np.abs(values), out=np.zeros_like(values), where=values != 0))
+    scale = 10.0 ** (SIGNIFICANT_DIGITS - 1 - magnitude)
+    return np.round(values * scale) / scale
+
+
+class ArchiveDay:
+    """
+    Read-only view of one archive file. Columns are NumPy arrays over a memory map of
+    the file, so opening a day costs nothing until rows are touched, and only the pages
+    of a selected time range are read. Use as a context manager.
+    """
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, length = PREAMBLE.unpack_from(self._map)
+        if magic != MAGIC:
+            self._map.close()
+            raise ValueError(f"{path} is not a readings archive")
+        header = json.loads(self._map[PREAMBLE.size:PREAMBLE.size + length])
+        base = PREAMBLE.size + length
+        self.rows = header["rows"]
+        self.devices = header["devices"]
+        self.columns = {
+            name: np.frombuffer(self._map, dtype=dtype, count=self.rows, offset=base + offset)
+            for name, (dtype, offset) in header["columns"].items()
+        }
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        # The arrays are views of the map and must go first
+        self.columns = {}
+        self._map.close()
+
+    def select(self, source_ids=None, start_ms=None, end_ms=None):
+        # Row indices (in file order) for the given sources within [start_ms, end_ms)
+        ts = self.columns["ts"]
+        lo = 0 if start_ms is None else int(np.searchsorted(ts, start_ms, side="left"))
+        hi = self.rows if end_ms is None else int(np.searchsorted(ts, end_ms, side="left"))
+        indices = np.arange(lo, hi)
+        if source_ids is not None:
+            indices = indices[np.isin(self.columns["source_id"][lo:hi], list(source_ids))]
+        return indices
+
+    def contains(self, ts, source_id, device_id):
+        # Whether the day holds a reading with this key (rows are sorted by ts)
+        c = self.columns
+        lo, hi = (int(np.searchsorted(c["ts"], ts, side=side)) for side in ("left", "right"))
+        return any(c["source_id"][i] == source_id and self.devices[c["device"][i]] == device_id for i in range(lo, hi))
+
+    def arrays(self, indices=None):
+        # Copies of the columns (device ids as strings) for `indices`, e.g. to rewrite the day
+        indices = np.arange(self.rows) if indices is None else indices
+        columns = {name: np.array(values[indices]) for name, values in self.columns.items()}
+        columns["device"] = np.asarray(self.devices, dtype=object)[columns["device"]]
+        return columns
+
+    def records(self, indices):
+        # Readings tuples (ts, source_id, device_id, temperature, humidity, apparent) for `indices`
+        c = self.columns
+        ts = c["ts"][indices].tolist()
+        source_id = c["source_id"][indices].tolist()
+        device = [self.devices[i] for i in c["device"][indices].tolist()]
+        values = [_significant(c[name][indices]).tolist() for name in ("temperature", "humidity", "apparent")]
+        return list(zip(ts, source_id, device, *values))
+
+
+class ArchiveStore:
+    """
+    Directory of per-day archive files (readings-YYYYMMDD.col, by local date) holding
+    readings moved out of readings.db by the retention job.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._until = (None, None)  # (directory mtime, archived_until()) as last computed
+
+    def path(self, day_start):
+        return os.path.join(self.directory, f"readings-{local_datetime(day_start):%Y%m%d}.col")
+
+    def days(self):
+        # [(day start ms, day end ms, path)] of every archived day, oldest first
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        days = []
+        for name in names:
+            match = FILE_PATTERN.match(name)
+            if match:
+                midnight = datetime(*map(int, match.groups()))
+                days.append((to_ms(midnight), to_ms(midnight + timedelta(days=1)),
+                             os.path.join(self.directory, name)))
+        return sorted(days)
+
+    def archived_until(self):
+        # End of the newest archived day (epoch ms), or None when nothing is archived. Writing a day
+        # renames its file into the directory, so the listing is redone only when the directory changes
+        try:
+            signature = os.stat(self.directory).st_mtime_ns
+        except FileNotFoundError:
+            return None
+        cached_signature, until = self._until
+        if signature != cached_signature:
+            days = self.days()
+            until = days[-1][1] if days else None
+            self._until = (signature, until)
+        return until
+
+    def archived(self, keys):
+        """
+        The (ts, source_id, device_id) keys among `keys` already held in an archive file.
+        readings.db's unique index only covers days still in SQLite, so readings re-sent
+        for an archived day are checked here instead. Only keys before archived_until()
+        open a file, one per day.
+        """
+        until = self.archived_until()
+        by_path = {}
+        for key in keys:
+            if until is not None and key[0] < until:
+                by_path.setdefault(self.path(key[0]), []).append(key)
+        found = set()
+        for path, day_keys in by_path.items():
+            try:
+                day = ArchiveDay(path)
+            except FileNotFoundError:
+                continue  # A day with no readings of its own was never written
+            with day:
+                found.update(key for key in day_keys if day.contains(*key))
+        return found
+
+    def iter_records(self, sources, start_ms, end_ms, chunk_rows):
+        # Lists of up to chunk_rows archived readings for the sources within [start_ms, end_ms), in order
+        source_ids = {SOURCE_IDS[source] for source in sources}
+        for day_start, day_end, path in self.days():
+            if day_end <= start_ms or day_start >= end_ms:
+                continue
+            try:
+                day = ArchiveDay(path)
+            except FileNotFoundError:
+                continue  # Replaced between listing and opening; the retention job never removes days
+            with day:
+                indices = day.select(source_ids, start_ms, end_ms)
+                for i in range(0, len(indices), chunk_rows):
+                    yield day.records(indices[i:i + chunk_rows])
+
+
+def merge_records(*streams):
+    """
+    Merges streams of readings chunks, each ordered by (ts, source_id, device_id), into
+    one ordered stream of rows, dropping a row already seen in another stream (e.g. a
+    day archived while its rows were still being deleted).
+    """
+    previous = None
+    rows = heapq.merge(*((row for chunk in stream for row in chunk) for stream in streams),
+                       key=lambda row: row[:3])
+    for row in rows:
+        if row[:3] != previous:
+            previous = row[:3]
+            yield row
+
+
+def archive_readings(conn, store, before_ms, batch_rows=BATCH_ROWS, progress=None):
+    """
+    Moves every reading older than `before_ms` (a local midnight) from readings.db into
+    per-day archive files, oldest day first. Each day is read, merged with any existing
+    file for that day (late readings), written, and only then deleted from SQLite in
+    transactions of `batch_rows`, so a crash at any point loses nothing and a rerun
+    picks up where it stopped. Only rows read into the file are deleted, so readings
+    arriving for the day meanwhile stay for the next run. Rollups are left alone and keep
+    serving history for archived days. `progress(day_start, rows)` is called per day.
+    """
+    started = time.perf_counter()
+    os.makedirs(store.directory, exist_ok=True)
+    days = moved = 0
+    while True:
+        # Per-source min(ts) is an index lookup; min over the whole table would scan it
+        firsts = [conn.execute("SELECT min(ts) FROM readings WHERE source_id = ?", (source_id,)).fetchone()[0]
+                  for source_id in SOURCE_IDS.values()]
+        firsts = [ts for ts in firsts if ts is not None and ts < before_ms]
+        if not firsts:
+            break
+        day_start, day_end = day_bounds(min(firsts))
+        day_end = min(day_end, before_ms)
+
+        columns = {name: [] for name in ("id", "ts", "source_id", "device", "temperature", "humidity", "apparent")}
+        for source_id in SOURCE_IDS.values():
+            cursor = conn.execute('''
+                SELECT id, ts, source_id, device_id, temperature, humidity, apparent
+                FROM readings
+                WHERE source_id = ? AND ts >= ? AND ts < ?
+            ''', (source_id, day_start, day_end))
+            while True:
+                chunk = cursor.fetchmany(50000)
+                if not chunk:
+                    break
+                for values, column in zip(zip(*chunk), columns.values()):
+                    column.extend(values)
+        if not columns["id"]:
+            break
+
+        path = store.path(day_start)
+        if os.path.exists(path):
+            with ArchiveDay(path) as existing:
+                previous = existing.arrays()
+            for name in ("ts", "source_id", "device", "temperature", "humidity", "apparent"):
+                columns[name] = np.concatenate([previous[name], np.asarray(columns[name], dtype=previous[name].dtype)])
+        write_day(path, columns["ts"], columns["source_id"], columns["device"],
+                  columns["temperature"], columns["humidity"], columns["apparent"])
+
+        # Delete exactly the rows now in the file, a batch per transaction so ingest keeps flowing
+        ids = sorted(columns["id"])
+        for i in range(0, len(ids), batch_rows):
+            with conn:
+                conn.executemany("DELETE FROM readings WHERE id = ?", ((id_,) for id_ in ids[i:i + batch_rows]))
+        days += 1
+        moved += len(ids)
+        if progress:
+            progress(day_start, len(ids))
+
+    reclaim_space(conn)
+    return ArchiveRun(days, moved, time.perf_counter() - started)
+
+
+def incremental_vacuum_enabled(conn):
+    return conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+
+
+def enable_incremental_vacuum(conn):
+    # Switch an existing file to auto_vacuum=INCREMENTAL; takes effect through one full VACUUM
+    conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    conn.execute("VACUUM")
+
+
+def reclaim_space(conn, pages=VACUUM_PAGES):
+    # Hand free pages back to the file system a step at a time, so no single lock is held for long
+    if not incremental_vacuum_enabled(conn):
+        return
+    while conn.execute("PRAGMA freelist_count").fetchone()[0]:
+        conn.execute(f"PRAGMA incremental_vacuum({int(pages)})").fetchall()
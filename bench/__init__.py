@@ -0,0 +1,4 @@
+"""
+Offline benchmark suite: seeded databases, a local BOM stub, a threaded HTTP load
+generator and microbenchmarks. Run with `python -m bench --help`.
+"""
@@ -0,0 +1,168 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+import bench
+from app import create_app
+from bench.bomstub import BomStub
+from bench.load import SCENARIOS, AppServer, run_scenario
+from bench.micro import run_micro
+from bench.seed import cached_readings, parse_size
+
+DEFAULT_CACHE_DIR = os.path.join(tempfile.gettempdir(), "heat-bench")
+
+# Lower is better for these result fields; everything else compared is higher-is-better
+LATENCY_FIELDS = ("mean_ms", "p50_ms", "p95_ms", "p99_ms")
+
+
+def _progress(label):
+    def report(done, total):
+        print(f"\r{label}: {done}/{total} rows", end="", file=sys.stderr, flush=True)
+        if done == total:
+            print(file=sys.stderr)
+    return report
+
+
+def _git_revision():
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run(args):
+    rows = parse_size(args.rows)
+    seeded = cached_readings(args.cache_dir, rows, args.seed, _progress(f"Seeding {args.rows}"))
+
+    with tempfile.TemporaryDirectory(prefix="heat-bench-") as workdir:
+        # Every run starts from a fresh copy of the seeded data
+        databases = {name: os.path.join(workdir, f"{name}.db") for name in ("users", "readings", "settings")}
+        shutil.copyfile(seeded, databases["readings"])
+
+        stub = BomStub().start()
+        started = time.perf_counter()
+        app = create_app({
+            "DATABASES": databases,
+            "BOM_STATIONS": [{"id": "94576", "name": "BOM stub", "url": stub.url}],
+            "WRITE_BEHIND": args.write_behind,
+        })
+        startup_seconds = time.perf_counter() - started
+        server = AppServer(app).start()
+
+        results = {
+            "meta": {
+                "revision": _git_revision(),
+                "python": platform.python_version(),
+                "sqlite": sqlite3.sqlite_version,
+                "platform": platform.platform(),
+                "cpus": os.cpu_count(),
+                "rows": rows,
+                "seed": args.seed,
+                "threads": args.threads,
+                "duration_seconds": args.duration,
+                "write_behind": args.write_behind,
+                "startup_seconds": round(startup_seconds, 3),
+            },
+            "scenarios": {},
+        }
+        try:
+            for name in args.scenarios:
+                print(f"Running {name}...", file=sys.stderr)
+                results["scenarios"][name] = run_scenario(server.url, SCENARIOS[name], threads=args.threads,
+                                                          duration=args.duration, warmup=args.warmup,
+                                                          seed=args.seed)
+            if not args.no_micro:
+                print("Running microbenchmarks...", file=sys.stderr)
+                results["micro"] = run_micro(app)
+        finally:
+            server.stop()
+            stub.stop()
+            write_behind = app.extensions.get("write_behind")
+            if write_behind is not None:
+                write_behind.close()
+    return results
+
+
+def compare(args):
+    # Relative change per scenario field between two result files (positive = new is better)
+    with open(args.old) as f:
+        old = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+
+    changes = {}
+    for section in ("scenarios", "micro"):
+        old_section, new_section = old.get(section, {}), new.get(section, {})
+        for name in sorted(set(old_section) & set(new_section)):
+            old_values, new_values = old_section[name], new_section[name]
+            if not isinstance(old_values, dict):
+                old_values, new_values, fields = {name: old_values}, {name: new_values}, [name]
+                key = f"micro.{name}"
+            else:
+                fields = ("throughput_rps",) + LATENCY_FIELDS
+                key = name
+            for field in fields:
+                before, after = old_values.get(field), new_values.get(field)
+                if not before or after is None:
+                    continue
+                lower_is_better = field in LATENCY_FIELDS or field.endswith("_ns")
+                change = (before - after) / before if lower_is_better else (after - before) / before
+                changes.setdefault(key, {})[field] = f"{change:+.1%}"
+    return {"old": old.get("meta", {}).get("revision"), "new": new.get("meta", {}).get("revision"),
+            "changes": changes}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m bench", description=bench.__doc__)
+    commands = parser.add_subparsers(dest="command")
+
+    run_parser = commands.add_parser("run", help="Seed, serve the app locally and drive it with load (default).")
+    run_parser.add_argument("--rows", default="10k", help="Seeded readings: 10k, 1m, 10m or a row count.")
+    run_parser.add_argument("--threads", type=int, default=8, help="Concurrent client threads.")
+    run_parser.add_argument("--duration", type=float, default=10.0, help="Measured seconds per scenario.")
+    run_parser.add_argument("--warmup", type=float, default=1.0, help="Unmeasured seconds before each scenario.")
+    run_parser.add_argument("--scenarios", nargs="+", default=list(SCENARIOS), choices=list(SCENARIOS))
+    run_parser.add_argument("--seed", type=int, default=0, help="Seed for synthetic data and request bodies.")
+    run_parser.add_argument("--write-behind", action="store_true", help="Run the app with WRITE_BEHIND enabled.")
+    run_parser.add_argument("--no-micro", action="store_true", help="Skip the microbenchmarks.")
+    run_parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR, help="Where seeded databases are kept.")
+    run_parser.add_argument("--output", help="Write the JSON results here instead of stdout.")
+
+    seed_parser = commands.add_parser("seed", help="Only create (or reuse) a seeded readings.db.")
+    seed_parser.add_argument("--rows", default="10k")
+    seed_parser.add_argument("--seed", type=int, default=0)
+    seed_parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR)
+
+    compare_parser = commands.add_parser("compare", help="Compare two result files.")
+    compare_parser.add_argument("old")
+    compare_parser.add_argument("new")
+
+    # "run" is the default command, so `python -m bench --rows 1m` works
+    argv = list(sys.argv[1:] if argv is None else argv)
+    if not argv or argv[0] not in (*commands.choices, "-h", "--help"):
+        argv.insert(0, "run")
+    args = parser.parse_args(argv)
+
+    if args.command == "seed":
+        path = cached_readings(args.cache_dir, parse_size(args.rows), args.seed, _progress(f"Seeding {args.rows}"))
+        print(path)
+        return
+    result = run(args) if args.command == "run" else compare(args)
+    text = json.dumps(result, indent=2)
+    if getattr(args, "output", None):
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
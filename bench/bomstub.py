@@ -0,0 +1,91 @@
+import http.server
+import json
+import threading
+from datetime import datetime, timedelta, timezone
+
+# Observations per feed, like the real 72-hour BOM feed at 30-minute intervals
+FEED_LENGTH = 144
+INTERVAL = timedelta(minutes=30)
+START = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+
+class BomStub:
+    """
+    Local stand-in for a BOM station feed. Every request returns a full feed whose
+    newest observation is one interval later than the previous response, so each
+    poll has exactly one new observation to store. With `advancing` off the feed
+    stays put and a request carrying its ETag gets 304, like the real server between
+    observations; setting `status` (e.g. 503) answers every request with that error.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0):
+        self.advancing = True
+        self.status = None
+        self.requests = 0       # Requests answered
+        self.not_modified = 0   # Requests answered 304 Not Modified
+        self._version = 0       # Feeds served so far; the newest observation moves one interval per version
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # Keep-alive, as the poller's sessions expect
+            disable_nagle_algorithm = True  # Headers and body go out in separate writes
+
+            def do_GET(self):
+                status, etag, body = stub.respond(self.headers.get("If-None-Match"))
+                self.send_response(status)
+                if etag:
+                    self.send_header("ETag", etag)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = http.server.ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/IDQ60901.94576.json"
+
+    def respond(self, if_none_match=None):
+        # (HTTP status, ETag, body) for one request
+        with self._lock:
+            self.requests += 1
+            if self.status is not None:
+                return self.status, None, b""
+            if self.advancing or not self._version:
+                self._version += 1
+            etag = f'"{self._version}"'
+            if if_none_match == etag:
+                self.not_modified += 1
+                return 304, etag, b""
+            newest = START + self._version * INTERVAL
+        return 200, etag, self.feed(newest)
+
+    @staticmethod
+    def feed(newest):
+        data = []
+        for i in range(FEED_LENGTH):
+            moment = newest - i * INTERVAL
+            data.append({
+                "aifstime_utc": moment.strftime("%Y%m%d%H%M%S"),
+                "local_date_time_full": (moment + timedelta(hours=10)).strftime("%Y%m%d%H%M%S"),
+                "air_temp": round(24 + (i % 12) * 0.5, 1),
+                "rel_hum": 55 + i % 20,
+            })
+        return json.dumps({"observations": {"data": data}}).encode()
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, name="bom-stub", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
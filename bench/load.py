@@ -0,0 +1,123 @@
+import random
+import threading
+import time
+from typing import Callable, NamedTuple
+
+import requests
+from werkzeug.serving import WSGIRequestHandler, make_server
+
+
+class Scenario(NamedTuple):
+    name: str
+    method: str
+    path: str
+    body: Callable = None   # Called per request with a random.Random; returns the JSON body
+
+
+def _inside_reading(rng):
+    return {"temperature": round(rng.uniform(24, 38), 1), "humidity": round(rng.uniform(30, 80), 1)}
+
+
+SCENARIOS = {
+    scenario.name: scenario for scenario in (
+        Scenario("ingest_inside", "POST", "/ingest/inside", _inside_reading),
+        Scenario("ingest_outside", "POST", "/ingest/outside"),
+        Scenario("dashboard", "GET", "/dashboard"),
+        Scenario("temperature_log", "GET", "/temperature-log"),
+        Scenario("threshold", "GET", "/threshold"),
+    )
+}
+
+
+class _QuietHandler(WSGIRequestHandler):
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+class AppServer:
+    # Serves a Flask app on a local port from a background thread (threaded, like a real deployment)
+    def __init__(self, app, host="127.0.0.1"):
+        self.server = make_server(host, 0, app, threaded=True, request_handler=_QuietHandler)
+        self._thread = threading.Thread(target=self.server.serve_forever, name="bench-server", daemon=True)
+
+    @property
+    def url(self):
+        return f"http://{self.server.host}:{self.server.port}"
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+
+
+def percentile(sorted_values, fraction):
+    # Nearest-rank percentile of an already sorted list
+    if not sorted_values:
+        return None
+    rank = max(int(round(fraction * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def run_scenario(base_url, scenario, threads=8, duration=10.0, warmup=1.0, seed=0):
+    """
+    Drives one scenario from `threads` client threads (one keep-alive session each)
+    for `duration` seconds after a warmup, and returns throughput and latency stats.
+    A response of 400 or above, or a connection error, counts as an error.
+    """
+    latencies = [[] for _ in range(threads)]
+    errors = [0] * threads
+    start_line = threading.Barrier(threads + 1)
+    timing = {}
+
+    def client(index):
+        rng = random.Random(seed * 1000 + index)
+        session = requests.Session()
+        url = base_url + scenario.path
+        start_line.wait()
+        measure_from = timing["start"] + warmup
+        stop_at = measure_from + duration
+        while True:
+            body = scenario.body(rng) if scenario.body else None
+            started = time.perf_counter()
+            if started >= stop_at:
+                break
+            try:
+                ok = session.request(scenario.method, url, json=body, timeout=30).status_code < 400
+            except requests.RequestException:
+                ok = False
+            finished = time.perf_counter()
+            if started < measure_from:
+                continue
+            latencies[index].append(finished - started)
+            if not ok:
+                errors[index] += 1
+        session.close()
+
+    workers = [threading.Thread(target=client, args=(i,), daemon=True) for i in range(threads)]
+    for worker in workers:
+        worker.start()
+    timing["start"] = time.perf_counter()
+    start_line.wait()
+    for worker in workers:
+        worker.join()
+
+    samples = sorted(latency for per_thread in latencies for latency in per_thread)
+    count = len(samples)
+
+    def ms(value):
+        return round(value * 1000, 3) if value is not None else None
+
+    return {
+        "threads": threads,
+        "duration_seconds": duration,
+        "requests": count,
+        "errors": sum(errors),
+        "throughput_rps": round(count / duration, 1),
+        "mean_ms": ms(sum(samples) / count) if count else None,
+        "p50_ms": ms(percentile(samples, 0.50)),
+        "p95_ms": ms(percentile(samples, 0.95)),
+        "p99_ms": ms(percentile(samples, 0.99)),
+        "max_ms": ms(samples[-1]) if count else None,
+    }
@@ -0,0 +1,41 @@
+import random
+import timeit
+
+from app import get_threshold
+from apparent import calc_apparent, calc_apparent_array
+from thresholds import get_thresholds
+
+# Inputs shared by every run so results are comparable
+_rng = random.Random(0)
+TEMPS = [round(_rng.uniform(15, 42), 1) for _ in range(1000)]
+RHS = [round(_rng.uniform(10, 95), 1) for _ in range(1000)]
+
+
+def _per_call_ns(func, number, repeat=5):
+    # Best of `repeat` runs, in nanoseconds per call
+    return round(min(timeit.repeat(func, number=number, repeat=repeat)) / number * 1e9, 1)
+
+
+def run_micro(app, number=20000):
+    """
+    Times the hot helpers: calc_apparent per reading, calc_apparent_array per reading of
+    a 1000-reading batch, and get_threshold / threshold classification from the cache.
+    Returns nanoseconds per call (per reading for the batch).
+    """
+    pairs = list(zip(TEMPS, RHS))
+    state = {"i": 0}
+
+    def one_apparent():
+        i = state["i"] = (state["i"] + 1) % len(pairs)
+        calc_apparent(*pairs[i])
+
+    results = {
+        "calc_apparent_ns": _per_call_ns(one_apparent, number),
+        "calc_apparent_array_per_row_ns": round(
+            _per_call_ns(lambda: calc_apparent_array(TEMPS, RHS), max(number // 100, 10)) / len(TEMPS), 1),
+    }
+    with app.app_context():
+        levels = get_thresholds()
+        results["get_threshold_ns"] = _per_call_ns(get_threshold, number)
+        results["classify_ns"] = _per_call_ns(lambda: levels.classify(31.4), number)
+    return results
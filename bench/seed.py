@@ -0,0 +1,79 @@
+import os
+import sqlite3
+
+import numpy as np
+
+from apparent import calc_apparent_array
+from rollups import init_rollups
+from timestamps import READINGS_INDEX, READINGS_SCHEMA, SOURCE_IDS
+
+# Named dataset sizes accepted by --rows
+SIZES = {"10k": 10_000, "1m": 1_000_000, "10m": 10_000_000}
+
+# Seeded data ends here (2025-01-01T00:00Z) so every run sees identical rows
+SEED_END_MS = 1_735_689_600_000
+
+STEP_MS = 30_000        # One reading every 30 seconds, oldest first
+OUTSIDE_EVERY = 10      # Every 10th reading comes from the BOM station
+SENSORS = 10            # Inside readings rotate over this many devices
+CHUNK_ROWS = 100_000    # Rows generated and inserted per batch
+
+
+def parse_size(text):
+    # "10k" / "1m" / "10m", or a plain row count
+    text = str(text).lower()
+    return SIZES[text] if text in SIZES else int(text)
+
+
+def _chunk(rng, first, count, total):
+    # Synthetic rows first..first+count: a daily temperature cycle with noise, humidity moving against it
+    index = np.arange(first, first + count)
+    ts = SEED_END_MS - (total - index) * STEP_MS
+    phase = 2 * np.pi * ((ts // 1000) % 86400) / 86400
+    outside = index % OUTSIDE_EVERY == 0
+    temps = np.round(27 + 6 * np.sin(phase - np.pi / 2) + np.where(outside, -3, 4) + rng.normal(0, 1.5, count), 1)
+    rhs = np.round(np.clip(60 - 15 * np.sin(phase - np.pi / 2) + rng.normal(0, 5, count), 5, 100), 1)
+    apparents = calc_apparent_array(temps, rhs)
+    source_ids = np.where(outside, SOURCE_IDS["outside"], SOURCE_IDS["inside"])
+    devices = ["94576" if out else f"sensor-{i % SENSORS}" for i, out in zip(index.tolist(), outside.tolist())]
+    return zip(ts.tolist(), source_ids.tolist(), temps.tolist(), rhs.tolist(), apparents.tolist(), devices)
+
+
+def seed_readings(path, rows, seed=0, progress=None):
+    """
+    Writes a fresh readings.db at `path` with `rows` deterministic synthetic readings
+    (same seed, same rows) plus its rollups. Journaling is off while loading and the
+    unique index is built once at the end, then the file is switched to WAL.
+    """
+    if os.path.exists(path):
+        os.remove(path)
+    rng = np.random.default_rng(seed)
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode = OFF")
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute(READINGS_SCHEMA.format(name="readings"))
+    with conn:
+        for first in range(0, rows, CHUNK_ROWS):
+            count = min(CHUNK_ROWS, rows - first)
+            conn.executemany('''
+                INSERT INTO readings (ts, source_id, temperature, humidity, apparent, device_id)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', _chunk(rng, first, count, rows))
+            if progress:
+                progress(first + count, rows)
+    with conn:
+        conn.execute(READINGS_INDEX)
+        init_rollups(conn)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.close()
+
+
+def cached_readings(cache_dir, rows, seed=0, progress=None):
+    # Path of a seeded database for (rows, seed), creating it on first use
+    os.makedirs(cache_dir, exist_ok=True)
+    path = os.path.join(cache_dir, f"readings-{rows}-{seed}.db")
+    if not os.path.exists(path):
+        partial = path + ".partial"
+        seed_readings(partial, rows, seed, progress)
+        os.replace(partial, path)
+    return path
@@ -0,0 +1,203 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone, tzinfo
+from typing import NamedTuple
+from zoneinfo import ZoneInfo
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from apparent import calc_apparent_array
+from db import get_db
+from metrics import Counter, Histogram
+from timestamps import SOURCE_IDS, format_iso, to_ms
+
+# Station every outside reading came from before stations were recorded per row, and its time zone
+LEGACY_STATION_ID = "94576"
+LEGACY_STATION_TZ = "Australia/Brisbane"
+
+# Default registry: BOM JSON feed for Brisbane Airport. "tz" is the zone of the feed's local times
+DEFAULT_STATIONS = [
+    {"id": "94576", "name": "Brisbane Airport", "url": "http://reg.bom.gov.au/fwo/IDQ60901/IDQ60901.94576.json",
+     "tz": "Australia/Brisbane"},
+]
+
+USER_AGENT = "heat-stress-monitor/1.0"
+
+FETCH_SECONDS = Histogram("heat_bom_fetch_seconds", "Time to fetch one station's BOM feed, including failures.",
+                          ["station"])
+POLL_RESULTS = Counter("heat_bom_poll_results_total", "BOM station polls by outcome (status=\"error\" counts failures).",
+                       ["station", "status"])
+
+
+class Station(NamedTuple):
+    id: str
+    name: str
+    url: str
+    tz: tzinfo = None   # Zone of local_date_time_full; None reads it as server-local
+
+
+class PollResult(NamedTuple):
+    station: str
+    status: str         # "updated", "unchanged", "not_modified" or "error"
+    stored: int = 0     # New observations written
+    latest: dict = None  # Newest observation in the feed, if parsed
+    error: str = None
+
+
+def load_stations(config):
+    # Station registry from the BOM_STATIONS setting (list of {"id", "name", "url", "tz"})
+    return [Station(str(s["id"]), s.get("name", str(s["id"])), s["url"], ZoneInfo(s["tz"]) if s.get("tz") else None)
+            for s in config]
+
+
+def station_zones(stations):
+    # Station id -> time zone of its local times, for outside rows stored in station time by older versions
+    zones = {LEGACY_STATION_ID: ZoneInfo(LEGACY_STATION_TZ)}
+    zones.update({station.id: station.tz for station in stations if station.tz is not None})
+    return zones
+
+
+def _observation_ms(reading, tz=None):
+    # Prefer the feed's UTC time (e.g. 20250711043000); fall back to its local time in the station's zone `tz`
+    # (server-local when unknown)
+    if reading.get("aifstime_utc"):
+        moment = datetime.strptime(reading["aifstime_utc"], "%Y%m%d%H%M%S").replace(tzinfo=timezone.utc)
+    else:
+        moment = datetime.strptime(reading["local_date_time_full"], "%Y%m%d%H%M%S").replace(tzinfo=tz)
+    return to_ms(moment)
+
+
+def parse_observations(bom_data, newer_than=None, tz=None):
+    """
+    (timestamp, temperature, humidity) for each usable observation in a BOM feed,
+    newest first, with timestamps in epoch milliseconds. The feed is ordered newest
+    first, so parsing stops at the first observation not newer than `newer_than`.
+    `tz` is the station's time zone, used when an observation has no UTC time.
+    """
+    parsed = []
+    for reading in bom_data["observations"]["data"]:
+        try:
+            timestamp = _observation_ms(reading, tz)
+        except (KeyError, ValueError, TypeError, AttributeError):
+            continue  # Skip malformed entries
+        if newer_than is not None and timestamp <= newer_than:
+            break
+        try:
+            parsed.append((timestamp, float(reading["air_temp"]), float(reading["rel_hum"])))
+        except (KeyError, ValueError, TypeError):
+            continue  # Missing or null measurements
+    return parsed
+
+
+class BomPoller:
+    """
+    Fetches every registered station in parallel and stores observations newer than
+    the last one stored for that station. Each worker thread keeps its own keep-alive
+    session, and feeds that have not changed since the previous poll are skipped with
+    If-None-Match / If-Modified-Since.
+    """
+
+    def __init__(self, stations, store, timeout=10):
+        self.stations = list(stations)
+        self.store = store      # Callable taking readings rows, returns the number stored
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=max(len(self.stations), 1),
+                                            thread_name_prefix="bom-poller")
+        self._local = threading.local()
+        self._validators = {}   # station id -> (ETag, Last-Modified) of the last 200 response
+        self._last_stored = {}  # station id -> newest stored timestamp (epoch ms)
+
+    def _session(self):
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = requests.Session()
+            session.headers["User-Agent"] = USER_AGENT
+            session.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=4))
+            session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=4))
+        return session
+
+    def _fetch(self, station):
+        # Returns the parsed feed, or None when the server says it has not changed
+        headers = {}
+        etag, last_modified = self._validators.get(station.id, (None, None))
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+
+        start = time.perf_counter()
+        try:
+            response = self._session().get(station.url, headers=headers, timeout=self.timeout)
+        finally:
+            FETCH_SECONDS.labels(station.id).observe(time.perf_counter() - start)
+        if response.status_code == 304:
+            return None
+        response.raise_for_status()
+        bom_data = response.json()
+        self._validators[station.id] = (response.headers.get("ETag"), response.headers.get("Last-Modified"))
+        return bom_data
+
+    def last_stored(self, station_id):
+        if station_id not in self._last_stored:
+            row = get_db("readings").execute('''
+                SELECT max(ts) FROM readings
+                WHERE source_id = ? AND device_id = ?
+            ''', (SOURCE_IDS["outside"], station_id)).fetchone()
+            self._last_stored[station_id] = row[0]
+        return self._last_stored[station_id]
+
+    def poll(self):
+        """
+        Polls every station concurrently and returns a PollResult per station. Network
+        work runs on the pool; parsing and storing happen on the calling thread so they
+        use its database connection.
+        """
+        # Look up where each station left off before fanning out
+        newer_than = {station.id: self.last_stored(station.id) for station in self.stations}
+        futures = [(station, self._executor.submit(self._fetch, station)) for station in self.stations]
+
+        results = []
+        for station, future in futures:
+            try:
+                bom_data = future.result()
+            except Exception as e:
+                # Network, HTTP or JSON errors: report and keep the other stations going
+                results.append(PollResult(station.id, "error", error=f"Failed to fetch BOM data: {e}"))
+                continue
+            if bom_data is None:
+                results.append(PollResult(station.id, "not_modified"))
+                continue
+            try:
+                new = parse_observations(bom_data, newer_than[station.id], station.tz)
+            except (KeyError, TypeError) as e:
+                results.append(PollResult(station.id, "error", error=f"Invalid BOM data structure: {e}"))
+                continue
+            try:
+                results.append(self._store(station, new))
+            except Exception as e:
+                # Database or write-behind errors: forget the validators so the next poll fetches
+                # these observations again, and keep the other stations going
+                self._validators.pop(station.id, None)
+                results.append(PollResult(station.id, "error", error=f"Failed to store BOM data: {e}"))
+        for result in results:
+            POLL_RESULTS.labels(result.station, result.status).inc()
+        return results
+
+    def _store(self, station, new):
+        if not new:
+            return PollResult(station.id, "unchanged")
+        apparents = calc_apparent_array([n[1] for n in new], [n[2] for n in new]).tolist()
+        rows = [
+            (timestamp, "outside", temp, rh, apparent, station.id)
+            for (timestamp, temp, rh), apparent in zip(new, apparents)
+        ]
+        stored = self.store(rows)
+        self._last_stored[station.id] = new[0][0]
+        timestamp, temp, rh, apparent = rows[0][0], rows[0][2], rows[0][3], rows[0][4]
+        latest = {"timestamp": format_iso(timestamp), "temperature": temp, "humidity": rh, "apparent": apparent}
+        return PollResult(station.id, "updated", stored, latest)
+
+    def close(self):
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,207 @@
+import contextlib
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: no file locks; run one process at a time there
+    fcntl = None
+
+from flask import g, has_app_context
+
+from metrics import QUERY_BUCKETS, Counter, Histogram
+
+# File paths of the three application databases, plus the scheduler lease (see leader.py). The lease is
+# renewed every few seconds, so it lives apart from settings.db, whose file changes invalidate cached thresholds
+DATABASES = {
+    "users": "users.db",
+    "readings": "readings.db",
+    "settings": "settings.db",
+    "leases": "leases.db",
+}
+
+# Applied to every new connection. WAL lets readers run alongside the scheduler's writer,
+# and busy_timeout makes a blocked writer wait instead of failing with "database is locked".
+PRAGMAS = (
+    # New files get incremental vacuum, so the retention job can return freed pages in steps. It has
+    # to come before journal_mode, which initialises an empty file (existing files are unaffected)
+    "PRAGMA auto_vacuum = INCREMENTAL",
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA busy_timeout = 5000",
+    "PRAGMA cache_size = -16000",      # 16 MB page cache per connection
+    "PRAGMA mmap_size = 268435456",    # Memory-map up to 256 MB of the file
+    "PRAGMA temp_store = MEMORY",
+)
+
+# Idle connections kept per database; extra ones are closed when released
+POOL_SIZE = 8
+
+# Prepared statements cached per connection (sqlite3 reuses them for identical SQL text)
+CACHED_STATEMENTS = 256
+
+
+QUERY_SECONDS = Histogram("heat_sqlite_query_seconds", "Time to execute one SQLite statement (or executemany batch).",
+                          ["database", "operation"], buckets=QUERY_BUCKETS)
+QUERY_ERRORS = Counter("heat_sqlite_query_errors_total", "SQLite statements that raised an error.", ["database"])
+
+
+class TimedConnection(sqlite3.Connection):
+    """
+    sqlite3 connection that records how long execute()/executemany() take, per database.
+    Only statement execution is timed; rows fetched lazily from the cursor afterwards are not.
+    """
+
+    def instrument(self, name):
+        self._name = name
+        self._execute_seconds = QUERY_SECONDS.labels(name, "execute")
+        self._executemany_seconds = QUERY_SECONDS.labels(name, "executemany")
+
+    def execute(self, sql, parameters=()):
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        except sqlite3.Error:
+            QUERY_ERRORS.labels(self._name).inc()
+            raise
+        finally:
+            self._execute_seconds.observe(time.perf_counter() - start)
+
+    def executemany(self, sql, parameters):
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, parameters)
+        except sqlite3.Error:
+            QUERY_ERRORS.labels(self._name).inc()
+            raise
+        finally:
+            self._executemany_seconds.observe(time.perf_counter() - start)
+
+
+def connect(name):
+    # Open a new tuned connection; rows support both index and column-name access
+    conn = sqlite3.connect(
+        DATABASES[name],
+        timeout=5.0,
+        check_same_thread=False,
+        cached_statements=CACHED_STATEMENTS,
+        factory=TimedConnection,
+    )
+    conn.instrument(name)
+    conn.row_factory = sqlite3.Row
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+class ConnectionPool:
+    """
+    Keeps long-lived connections to one database so requests and jobs don't pay
+    the connect and pragma cost (or lose their statement cache) every time.
+    """
+
+    def __init__(self, name, size=POOL_SIZE):
+        self.name = name
+        self.size = size
+        self._idle = queue.LifoQueue()
+
+    def acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return connect(self.name)
+
+    def release(self, conn):
+        # Never hand a half-finished transaction to the next user
+        if conn.in_transaction:
+            conn.rollback()
+        if self._idle.qsize() < self.size:
+            self._idle.put(conn)
+        else:
+            conn.close()
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+_pools = {name: ConnectionPool(name) for name in DATABASES}
+
+# Connections for code running outside a Flask app context (startup, ad-hoc scripts)
+_local = threading.local()
+
+
+def get_db(name):
+    """
+    Returns the connection to use for database `name` ("users", "readings", "settings" or "leases").
+    Inside an app context a pooled connection is checked out once and returned at teardown;
+    elsewhere each thread keeps its own long-lived connection.
+    """
+    if has_app_context():
+        connections = g.setdefault("_db_connections", {})
+    else:
+        connections = getattr(_local, "connections", None)
+        if connections is None:
+            connections = _local.connections = {}
+
+    conn = connections.get(name)
+    if conn is None:
+        conn = connections[name] = _pools[name].acquire()
+    return conn
+
+
+def release_connections(exc=None):
+    # Return every connection checked out by this app context to its pool
+    connections = g.pop("_db_connections", {})
+    for name, conn in connections.items():
+        _pools[name].release(conn)
+
+
+def close_all():
+    # Close pooled connections and this thread's own ones (e.g. before replacing database files)
+    for pool in _pools.values():
+        pool.close()
+    connections = getattr(_local, "connections", {})
+    for conn in connections.values():
+        conn.close()
+    connections.clear()
+
+
+@contextlib.contextmanager
+def init_lock():
+    """
+    Exclusive lock shared by every process using these databases, held while schemas
+    are created or migrated. Workers started together (e.g. gunicorn -w 8) take turns,
+    and each one's checks see what the processes before it already did. The lock is a
+    file beside readings.db.
+    """
+    if fcntl is None:
+        yield
+        return
+    with open(DATABASES["readings"] + "-lock", "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def configure(databases):
+    # Point the pools at other database files (e.g. a temporary directory in tests)
+    close_all()
+    DATABASES.update(databases)
+
+
+def init_app(app):
+    databases = dict(app.config["DATABASES"])
+    if "leases" not in databases and "settings" in databases:
+        # Configs naming only the application databases keep the lease file beside settings.db
+        databases["leases"] = os.path.join(os.path.dirname(databases["settings"]), "leases.db")
+    configure(databases)
+    app.teardown_appcontext(release_connections)
@@ -0,0 +1,111 @@
+import csv
+import io
+import json
+import zlib
+from itertools import islice
+
+from archive import merge_records
+from db import get_db
+from timestamps import SOURCE_IDS, SOURCE_NAMES, format_iso
+
+# Rows fetched from the cursor (and encoded) per chunk of the response
+EXPORT_CHUNK_ROWS = 1000
+
+EXPORT_COLUMNS = ("timestamp", "ts", "source", "device_id", "temperature", "humidity", "apparent")
+
+EXPORT_FORMATS = {
+    # format: (MIME type, file extension)
+    "csv": ("text/csv", "csv"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+}
+
+
+def iter_readings(sources, start_ms, end_ms, chunk_rows=EXPORT_CHUNK_ROWS, conn=None, archive=None):
+    """
+    Yields lists of up to `chunk_rows` readings rows (ts, source_id, device_id,
+    temperature, humidity, apparent) for the given sources with start_ms <= ts < end_ms,
+    ordered by (ts, source_id, device_id). Rows are pulled from one cursor with
+    fetchmany, so memory stays bounded however many rows match. `conn` defaults to this
+    context's readings connection. With an ArchiveStore as `archive`, days moved out of
+    SQLite by the retention job are merged in from their archive files.
+    """
+    source_ids = [SOURCE_IDS[source] for source in sources]
+    cursor = (conn or get_db("readings")).execute(f'''
+        SELECT ts, source_id, device_id, temperature, humidity, apparent
+        FROM readings
+        WHERE source_id IN ({", ".join("?" * len(source_ids))}) AND ts >= ? AND ts < ?
+        ORDER BY ts, source_id, device_id
+    ''', (*source_ids, start_ms, end_ms))
+    try:
+        # The first fetch pins the read snapshot; archive days are listed after it, so a day the
+        # retention job moves meanwhile is still seen in one place or the other
+        first = cursor.fetchmany(chunk_rows)
+        archived = archive is not None and any(
+            day_start < end_ms and day_end > start_ms for day_start, day_end, _ in archive.days())
+        hot = _chunks(first, cursor, chunk_rows)
+        if not archived:
+            yield from hot
+            return
+        rows = merge_records(archive.iter_records(sources, start_ms, end_ms, chunk_rows), hot)
+        while True:
+            chunk = list(islice(rows, chunk_rows))
+            if not chunk:
+                return
+            yield chunk
+    finally:
+        # Release the read snapshot even when the client disconnects mid-export
+        cursor.close()
+
+
+def _chunks(first, cursor, chunk_rows):
+    rows = first
+    while rows:
+        yield rows
+        rows = cursor.fetchmany(chunk_rows)
+
+
+def _records(rows):
+    for ts, source_id, device_id, temperature, humidity, apparent in rows:
+        yield (format_iso(ts), ts, SOURCE_NAMES[source_id], device_id, temperature, humidity, apparent)
+
+
+def encode_csv(chunks):
+    # Header line, then one block of CSV text per chunk of rows
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(EXPORT_COLUMNS)
+    for rows in chunks:
+        writer.writerows(_records(rows))
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    # An export with no rows still returns the header
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+def encode_ndjson(chunks):
+    # One JSON object per line
+    for rows in chunks:
+        yield "".join(
+            json.dumps(dict(zip(EXPORT_COLUMNS, record))) + "\n" for record in _records(rows)
+        ).encode()
+
+
+ENCODERS = {"csv": encode_csv, "ndjson": encode_ndjson}
+
+
+def gzip_stream(blocks, level=6):
+    # Compress a stream of byte blocks on the fly; each block is flushed so clients see progress
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits 31 = gzip container
+    for block in blocks:
+        data = compressor.compress(block) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_stream(sources, start_ms, end_ms, fmt, compress=False, archive=None):
+    # Byte chunks of a whole export, encoded as `fmt` ("csv" or "ndjson") and optionally gzipped
+    blocks = ENCODERS[fmt](iter_readings(sources, start_ms, end_ms, archive=archive))
+    return gzip_stream(blocks) if compress else blocks
@@ -0,0 +1,186 @@
+"""
+Compact binary ingest format for sensor nodes and gateways.
+
+A frame is a 6-byte header followed by `count` fixed-size records, all little-endian:
+
+    Header (6 bytes)
+      0  2s  magic        b"HT"
+      2  B   version      1
+      3  B   record size  32 (lets a receiver reject frames built for another layout)
+      4  H   count        records in the frame, 1..MAX_FRAME_RECORDS
+
+    Record (32 bytes)
+      0  16s device id    ASCII, NUL-padded
+     16  q   timestamp    epoch milliseconds, UTC; 0 = time the frame is received
+     24  f   temperature  °C, float32
+     28  f   humidity     % relative humidity, float32
+
+One reading costs 32 bytes against roughly 90 as a JSON object. Frames go to
+POST /ingest/inside/batch with Content-Type: application/octet-stream, one frame per
+UDP datagram, or back to back on a TCP connection, where every frame is answered with
+a 5-byte ACK (status B, accepted H, rejected H).
+"""
+import logging
+import socket
+import socketserver
+import struct
+import threading
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"HT"
+VERSION = 1
+HEADER = struct.Struct("<2sBBH")
+RECORD = struct.Struct("<16sqff")
+ACK = struct.Struct("<BHH")
+DEVICE_ID_BYTES = 16
+
+# Most records in one frame: 32 KB of payload, and under a typical 64 KB UDP datagram
+MAX_FRAME_RECORDS = 1024
+
+# ACK status codes (TCP)
+ACK_OK = 0
+ACK_BAD_FRAME = 1
+ACK_BUSY = 2            # Write-behind queue full; resend the frame shortly
+
+
+class FrameError(ValueError):
+    """The bytes are not a well-formed frame."""
+
+
+def parse_header(data):
+    # (count, frame length in bytes) from the first HEADER.size bytes of a frame
+    if len(data) < HEADER.size:
+        raise FrameError("Frame shorter than its header")
+    magic, version, record_size, count = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise FrameError("Not a reading frame")
+    if version != VERSION or record_size != RECORD.size:
+        raise FrameError(f"Unsupported frame version {version} with {record_size}-byte records")
+    if not 1 <= count <= MAX_FRAME_RECORDS:
+        raise FrameError(f"Frame must hold 1 to {MAX_FRAME_RECORDS} records")
+    return count, HEADER.size + count * RECORD.size
+
+
+def parse_frame(data):
+    """
+    Unpacks a whole frame into (device id bytes, timestamp, temperature, humidity)
+    tuples. Records are read in place through a memoryview; the only copies made are
+    the values themselves.
+    """
+    view = memoryview(data)
+    count, length = parse_header(view)
+    if len(view) != length:
+        raise FrameError(f"Frame of {count} records must be {length} bytes, got {len(view)}")
+    # float32 fields come back as the nearest double (30.1 -> 30.100000381...); keep their 7 significant digits
+    return [(device, ts, float(f"{temperature:.7g}"), float(f"{humidity:.7g}"))
+            for device, ts, temperature, humidity in RECORD.iter_unpack(view[HEADER.size:])]
+
+
+def decode_device_id(raw):
+    # Device id field -> str; NUL padding stripped, non-ASCII rejected like a missing id
+    try:
+        return raw.rstrip(b"\0").decode("ascii")
+    except UnicodeDecodeError:
+        return ""
+
+
+def encode_frame(records):
+    # Reference encoder: a frame from (device_id, timestamp ms or 0, temperature, humidity) tuples
+    records = list(records)
+    buffer = bytearray(HEADER.size + len(records) * RECORD.size)
+    HEADER.pack_into(buffer, 0, MAGIC, VERSION, RECORD.size, len(records))
+    for i, (device_id, ts, temperature, humidity) in enumerate(records):
+        device = device_id.encode("ascii")
+        if len(device) > DEVICE_ID_BYTES:
+            raise ValueError(f"Device id longer than {DEVICE_ID_BYTES} bytes: {device_id}")
+        RECORD.pack_into(buffer, HEADER.size + i * RECORD.size, device, ts, temperature, humidity)
+    return bytes(buffer)
+
+
+class FrameListener:
+    """
+    UDP and/or TCP servers receiving frames for `handle(data)`, which validates and
+    stores one frame and returns an ACK status and the accepted and rejected counts.
+    UDP datagrams are handled one at a time on the listener thread; each TCP
+    connection (typically a gateway) gets its own thread and an ACK per frame.
+    """
+
+    def __init__(self, handle, udp=None, tcp=None):
+        self.handle = handle
+        self.servers = []
+        self._started = False
+        listener = self
+
+        class DatagramHandler(socketserver.BaseRequestHandler):
+            def handle(self):
+                listener.receive(self.request[0], self.client_address)
+
+        class StreamHandler(socketserver.StreamRequestHandler):
+            disable_nagle_algorithm = True  # ACKs are tiny and the gateway waits for each one
+
+            def handle(self):
+                while True:
+                    header = self.rfile.read(HEADER.size)
+                    if len(header) < HEADER.size:
+                        return
+                    try:
+                        _, length = parse_header(header)
+                    except FrameError as e:
+                        # The stream is out of step; nothing after this can be trusted
+                        logger.warning("Bad frame from %s: %s", self.client_address[0], e)
+                        self.wfile.write(ACK.pack(ACK_BAD_FRAME, 0, 0))
+                        return
+                    body = self.rfile.read(length - HEADER.size)
+                    if len(body) < length - HEADER.size:
+                        return
+                    self.wfile.write(ACK.pack(*listener.receive(header + body, self.client_address)))
+
+        try:
+            if udp:
+                server = socketserver.UDPServer(udp, DatagramHandler)
+                server.max_packet_size = HEADER.size + MAX_FRAME_RECORDS * RECORD.size  # Default is 8 KB
+                self.servers.append(server)
+            if tcp:
+                server = socketserver.ThreadingTCPServer(tcp, StreamHandler, bind_and_activate=False)
+                server.daemon_threads = True
+                server.allow_reuse_address = True
+                self.servers.append(server)
+                server.server_bind()
+                server.server_activate()
+        except OSError:
+            # e.g. the port is in use: give back whatever was bound so the caller can retry
+            self.stop()
+            raise
+
+    def receive(self, data, client):
+        try:
+            return self.handle(data)
+        except FrameError as e:
+            logger.warning("Bad frame from %s: %s", client[0], e)
+            return ACK_BAD_FRAME, 0, 0
+        except Exception:
+            logger.exception("Storing a frame from %s failed", client[0])
+            return ACK_BUSY, 0, 0
+
+    @staticmethod
+    def _transport(server):
+        return "udp" if server.socket_type == socket.SOCK_DGRAM else "tcp"
+
+    @property
+    def addresses(self):
+        # {"udp"/"tcp": (host, port)} actually bound, e.g. when port 0 picked a free one
+        return {self._transport(server): server.server_address[:2] for server in self.servers}
+
+    def start(self):
+        for server in self.servers:
+            threading.Thread(target=server.serve_forever, name=f"frames-{self._transport(server)}",
+                             daemon=True).start()
+        self._started = True
+        return self
+
+    def stop(self):
+        for server in self.servers:
+            if self._started:
+                server.shutdown()  # Waits for serve_forever(), so only once it runs
+            server.server_close()
@@ -0,0 +1,14 @@
+# gunicorn settings, read automatically when started from this directory: `gunicorn wsgi:app`
+import os
+
+# Every open dashboard holds a /stream request (Server-Sent Events) for as long as it is shown, so workers
+# serve requests on a pool of threads; with the default sync worker, one open dashboard per worker would
+# leave nothing to answer other requests
+worker_class = "gthread"
+workers = int(os.environ.get("WEB_CONCURRENCY", 8))
+# Requests (open dashboards included) each worker serves at once
+threads = int(os.environ.get("GUNICORN_THREADS", 32))
+
+# Not preloaded: each worker builds its own app and starts its own lease, catch-up and write-behind
+# threads, which would not survive the fork
+preload_app = False
@@ -0,0 +1,112 @@
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import uuid
+
+from db import connect
+from timestamps import now_ms
+
+logger = logging.getLogger(__name__)
+
+# Default for LEADER_LEASE_SECONDS: how long a leader that stops renewing keeps the lease
+LEASE_SECONDS = 30
+# Candidates try to take (and the leader renews) the lease this many times per lease period
+RENEWALS_PER_LEASE = 3
+
+
+def init_leases(conn):
+    # One row per elected role; whoever holds an unexpired row is that role's leader
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS leases (
+            name TEXT PRIMARY KEY,
+            holder TEXT NOT NULL,           -- host:pid:nonce of the holding process
+            expires INTEGER NOT NULL        -- Epoch ms the lease lapses unless renewed
+        )
+    ''')
+
+
+class LeaderLease:
+    """
+    Elects one process out of all those sharing a database (e.g. gunicorn workers) to
+    run background work, using a lease row in the `leases` table.
+
+    Every candidate runs a thread that tries to take the row every lease_seconds /
+    RENEWALS_PER_LEASE; the update only succeeds when the row is free, expired or
+    already ours, so it doubles as the leader's renewal. A leader that dies or hangs
+    stops renewing and another candidate takes over once the lease expires; a clean
+    shutdown releases it for the next candidate straight away. `on_elected` and
+    `on_demoted` run on the lease thread.
+    """
+
+    def __init__(self, name, database="leases", lease_seconds=LEASE_SECONDS, on_elected=None, on_demoted=None):
+        self.name = name
+        self.database = database
+        self.lease_ms = int(lease_seconds * 1000)
+        self.on_elected = on_elected
+        self.on_demoted = on_demoted
+        self.holder = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.is_leader = False
+        self._expires = 0
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def try_acquire(self, conn):
+        # Take or renew the lease; True if this process holds it afterwards
+        now = now_ms()
+        with conn:
+            acquired = conn.execute('''
+                INSERT INTO leases (name, holder, expires) VALUES (?, ?, ?)
+                ON CONFLICT (name) DO UPDATE SET holder = excluded.holder, expires = excluded.expires
+                WHERE leases.holder = excluded.holder OR leases.expires < ?
+            ''', (self.name, self.holder, now + self.lease_ms, now)).rowcount == 1
+        if acquired:
+            self._expires = now + self.lease_ms
+        return acquired
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name=f"lease-{self.name}", daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        conn = connect(self.database)
+        try:
+            while not self._stopping.is_set():
+                try:
+                    acquired = self.try_acquire(conn)
+                except sqlite3.Error as e:
+                    # Keep leading while the lease we already hold is still valid
+                    logger.warning("Lease %s check failed: %s", self.name, e)
+                    acquired = self.is_leader and now_ms() < self._expires
+                if acquired != self.is_leader:
+                    self._set_leader(acquired)
+                self._stopping.wait(self.lease_ms / 1000 / RENEWALS_PER_LEASE)
+        finally:
+            conn.close()
+
+    def _set_leader(self, leader):
+        self.is_leader = leader
+        logger.info("%s %s lease %s", self.holder, "acquired" if leader else "lost", self.name)
+        callback = self.on_elected if leader else self.on_demoted
+        if callback is not None:
+            try:
+                callback()
+            except Exception:
+                logger.exception("Lease %s %s callback failed", self.name, "election" if leader else "demotion")
+
+    def stop(self):
+        # Stop competing and, if leading, give the lease up so another process takes over now
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+        if self.is_leader:
+            self._set_leader(False)
+            conn = connect(self.database)
+            try:
+                with conn:
+                    conn.execute("UPDATE leases SET expires = 0 WHERE name = ? AND holder = ?",
+                                 (self.name, self.holder))
+            finally:
+                conn.close()
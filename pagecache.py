@@ -0,0 +1,83 @@
+import hashlib
+import threading
+import zlib
+from collections import OrderedDict
+
+# Rendered pages kept in memory (least recently used dropped first)
+PAGE_CACHE_SIZE = 256
+
+
+class DataVersion:
+    """
+    Version number of a dataset that only moves forward. The readings version is the
+    highest readings.id whose row (and every older one) this process's in-memory views
+    reflect; ids are shared by all processes, so equal versions mean equal data in
+    every worker.
+    """
+
+    def __init__(self, value=0):
+        self._value = value
+        self._lock = threading.Lock()
+
+    @property
+    def value(self):
+        return self._value
+
+    def advance(self, value):
+        with self._lock:
+            if value > self._value:
+                self._value = value
+
+    def reset(self, value=0):
+        # Start over, e.g. when create_app() points the process at other database files
+        with self._lock:
+            self._value = value
+
+
+# Shared by the whole process
+readings_version = DataVersion()
+
+
+def thresholds_version(thresholds):
+    # Checksum of the bands; unlike hash() it is the same in every process
+    return zlib.crc32(repr(thresholds.bands).encode())
+
+
+def page_etag(key):
+    # Weak ETag for a page key (endpoint, query, versions, signed in, role): equal keys render equal pages
+    return hashlib.blake2b(repr(key).encode(), digest_size=12).hexdigest()
+
+
+class PageCache:
+    """
+    Rendered page bodies keyed by everything they depend on, so a new reading or a
+    threshold change moves pages to new keys instead of needing invalidation; stale
+    entries age out of the LRU.
+    """
+
+    def __init__(self, size=PAGE_CACHE_SIZE):
+        self.size = size
+        self._pages = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            body = self._pages.get(key)
+            if body is not None:
+                self._pages.move_to_end(key)
+            return body
+
+    def put(self, key, body):
+        with self._lock:
+            self._pages[key] = body
+            self._pages.move_to_end(key)
+            while len(self._pages) > self.size:
+                self._pages.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._pages.clear()
+
+
+# Shared by the whole process
+page_cache = PageCache()
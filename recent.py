@@ -0,0 +1,137 @@
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import NamedTuple
+
+from db import get_db
+from timestamps import SOURCE_IDS
+
+# Readings kept in memory per source
+RECENT_CAPACITY = 1000
+
+
+class Reading(NamedTuple):
+    timestamp: int      # Epoch milliseconds
+    temperature: float
+    humidity: float
+    apparent: float
+
+
+class ReadingRing:
+    """
+    The newest `capacity` readings of one source, ordered by timestamp.
+
+    Columns live in typed arrays (8 bytes per value) sized up to twice the capacity;
+    when full the oldest half is dropped in one slice, so appends are amortised O(1).
+    Late readings with an older timestamp are inserted in order.
+    """
+
+    def __init__(self, capacity=RECENT_CAPACITY):
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self._ts = array("q")
+        self._temperature = array("d")
+        self._humidity = array("d")
+        self._apparent = array("d")
+        self._device = []
+
+    def __len__(self):
+        return min(len(self._ts), self.capacity)
+
+    def add(self, ts, temperature, humidity, apparent, device_id=""):
+        with self._lock:
+            n = len(self._ts)
+            if n == 0 or ts > self._ts[-1]:
+                position = n
+            else:
+                # Out-of-order or duplicate reading
+                lo = bisect_left(self._ts, ts)
+                hi = bisect_right(self._ts, ts)
+                if device_id in self._device[lo:hi]:
+                    return
+                position = hi
+                if position == 0 and n >= self.capacity:
+                    return  # Older than everything we keep
+
+            for column, value in ((self._ts, ts), (self._temperature, temperature),
+                                  (self._humidity, humidity), (self._apparent, apparent),
+                                  (self._device, device_id)):
+                column.insert(position, value)
+
+            if len(self._ts) >= 2 * self.capacity:
+                drop = len(self._ts) - self.capacity
+                for column in (self._ts, self._temperature, self._humidity, self._apparent, self._device):
+                    del column[:drop]
+
+    def newest(self, limit):
+        # Up to `limit` readings, newest first (same order as ORDER BY ts DESC)
+        with self._lock:
+            start = max(len(self._ts) - min(limit, self.capacity), 0)
+            ts = self._ts[start:]
+            temperature = self._temperature[start:]
+            humidity = self._humidity[start:]
+            apparent = self._apparent[start:]
+        return [
+            Reading(ts[i], temperature[i], humidity[i], apparent[i])
+            for i in range(len(ts) - 1, -1, -1)
+        ]
+
+    def latest(self):
+        rows = self.newest(1)
+        return rows[0] if rows else None
+
+    def clear(self):
+        with self._lock:
+            for column in (self._ts, self._temperature, self._humidity, self._apparent):
+                del column[:]
+            self._device.clear()
+
+
+class RecentReadings:
+    """
+    Registry of ReadingRing buffers, one per source. Every ingest path writes
+    through to it so the dashboard and recent-log views never query SQLite.
+    """
+
+    def __init__(self, capacity=RECENT_CAPACITY):
+        self.capacity = capacity
+        self._rings = {}
+        self._lock = threading.Lock()
+
+    def ring(self, key):
+        ring = self._rings.get(key)
+        if ring is None:
+            with self._lock:
+                ring = self._rings.setdefault(key, ReadingRing(self.capacity))
+        return ring
+
+    def add_rows(self, rows):
+        # rows: (ts, source, temperature, humidity, apparent, device_id) as stored by insert_readings
+        for ts, source, temperature, humidity, apparent, device_id in rows:
+            self.ring(source).add(ts, temperature, humidity, apparent, device_id)
+
+    def latest(self, source):
+        return self.ring(source).latest()
+
+    def newest(self, source, limit):
+        return self.ring(source).newest(limit)
+
+    def warm(self, sources=("inside", "outside")):
+        # Fill each ring with the newest rows from readings.db (run once at startup)
+        conn = get_db("readings")
+        for source in sources:
+            ring = self.ring(source)
+            ring.clear()
+            rows = conn.execute('''
+                SELECT ts, temperature, humidity, apparent, device_id
+                FROM readings
+                WHERE source_id = ?
+                ORDER BY ts DESC
+                LIMIT ?
+            ''', (SOURCE_IDS[source], self.capacity)).fetchall()
+            for row in reversed(rows):
+                ring.add(*row)
+
+
+# Shared by the whole process
+recent = RecentReadings()
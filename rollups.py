@@ -0,0 +1,171 @@
+from datetime import timedelta
+
+from db import get_db
+from timestamps import SOURCE_IDS, local_datetime, to_ms
+
+# Bucket start (epoch ms) for each granularity, as an SQL expression over an epoch-ms column.
+# Minute and hour buckets are aligned in UTC; day buckets start at local midnight.
+GRANULARITIES = {
+    "minute": ("({ts} - {ts} % 60000)", timedelta(minutes=1)),
+    "hour": ("({ts} - {ts} % 3600000)", timedelta(hours=1)),
+    "day": ("(CAST(strftime('%s', {ts} / 1000, 'unixepoch', 'localtime', 'start of day', 'utc') AS INTEGER) * 1000)",
+            timedelta(days=1)),
+}
+
+# Metrics summarised in every bucket
+METRICS = ("temperature", "humidity", "apparent")
+
+# Most buckets a range query should return; the finest granularity under this is used
+MAX_POINTS = 2500
+
+# Rows per page of a range query
+DEFAULT_PAGE_SIZE = 500
+MAX_PAGE_SIZE = 5000
+
+
+def _columns():
+    return [f"{metric}_{stat}" for metric in METRICS for stat in ("min", "max", "sum")]
+
+
+def _upsert_sql(granularity, ts):
+    # Add one reading (the NEW row inside the trigger) to its bucket
+    bucket = GRANULARITIES[granularity][0].format(ts=ts)
+    values = ", ".join(f"NEW.{metric}" for metric in METRICS for _ in range(3))
+    updates = ", ".join(
+        f"{metric}_min = min({metric}_min, excluded.{metric}_min), "
+        f"{metric}_max = max({metric}_max, excluded.{metric}_max), "
+        f"{metric}_sum = {metric}_sum + excluded.{metric}_sum"
+        for metric in METRICS
+    )
+    return f'''
+        INSERT INTO rollups (granularity, source_id, bucket, count, {", ".join(_columns())})
+        VALUES ('{granularity}', NEW.source_id, {bucket}, 1, {values})
+        ON CONFLICT (granularity, source_id, bucket) DO UPDATE SET count = count + 1, {updates};
+    '''
+
+
+def _backfill_sql(granularity, where=""):
+    # Rebuild one granularity from the raw readings table (optionally only rows matching `where`)
+    bucket = GRANULARITIES[granularity][0].format(ts="ts")
+    aggregates = ", ".join(f"min({metric}), max({metric}), sum({metric})" for metric in METRICS)
+    return f'''
+        INSERT INTO rollups (granularity, source_id, bucket, count, {", ".join(_columns())})
+        SELECT '{granularity}', source_id, {bucket}, count(*), {aggregates}
+        FROM readings
+        {where}
+        GROUP BY source_id, {bucket}
+    '''
+
+
+def init_rollups(conn):
+    """
+    Creates the rollups table and the trigger that keeps it current. Every row inserted
+    into readings (by any process) is added to its minute, hour and day bucket in the
+    same transaction; rows skipped by ON CONFLICT DO NOTHING never reach the trigger.
+    Existing readings are summarised once when the table is first created.
+    """
+    table_exists = conn.execute('''
+        SELECT count(*) FROM sqlite_master
+        WHERE type='table' AND name='rollups'
+    ''').fetchone()[0]
+    if table_exists:
+        return
+
+    # Table, trigger and backfill commit together (sqlite3 would otherwise autocommit the DDL)
+    if not conn.in_transaction:
+        conn.execute("BEGIN")
+    stats = ",\n".join(f"                {column} REAL NOT NULL" for column in _columns())
+    conn.execute(f'''
+        CREATE TABLE rollups (
+            granularity TEXT NOT NULL,
+            source_id INTEGER NOT NULL,
+            bucket INTEGER NOT NULL,            -- Bucket start, epoch milliseconds
+            count INTEGER NOT NULL,
+{stats},
+            PRIMARY KEY (granularity, source_id, bucket)
+        ) WITHOUT ROWID
+    ''')
+    body = "".join(_upsert_sql(granularity, "NEW.ts") for granularity in GRANULARITIES)
+    conn.execute(f'''
+        CREATE TRIGGER readings_rollup AFTER INSERT ON readings
+        BEGIN
+            {body}
+        END
+    ''')
+    for granularity in GRANULARITIES:
+        conn.execute(_backfill_sql(granularity))
+
+
+def rebuild_rollups(since_ms=None):
+    """
+    Recomputes buckets from raw readings, e.g. after stored apparent values were
+    rewritten. With `since_ms` (where archived readings end) only buckets starting at
+    or after it are rebuilt; older ones summarise readings no longer in SQLite and are kept.
+    """
+    with get_db("readings") as conn:
+        if since_ms is None:
+            conn.execute("DELETE FROM rollups")
+            for granularity in GRANULARITIES:
+                conn.execute(_backfill_sql(granularity))
+            return
+        for granularity in GRANULARITIES:
+            first = next_bucket_start(since_ms, granularity)
+            conn.execute("DELETE FROM rollups WHERE granularity = ? AND bucket >= ?", (granularity, first))
+            conn.execute(_backfill_sql(granularity, f"WHERE ts >= {int(first)}"))
+
+
+def pick_granularity(start, end, max_points=MAX_POINTS):
+    # Finest granularity whose bucket count over [start, end) (datetimes) stays within max_points
+    span = end - start
+    for granularity, (_, width) in GRANULARITIES.items():
+        if span / width <= max_points:
+            return granularity
+    return "day"
+
+
+def bucket_start(ms, granularity):
+    # Start (epoch ms) of the bucket containing an epoch-ms time; matches the SQL expressions above
+    if granularity == "day":
+        # Naive local midnight, so to_ms() applies that day's UTC offset (DST changes)
+        midnight = local_datetime(ms).replace(hour=0, minute=0, second=0, microsecond=0, tzinfo=None)
+        return to_ms(midnight)
+    width = GRANULARITIES[granularity][1] // timedelta(milliseconds=1)
+    return ms - ms % width
+
+
+def next_bucket_start(ms, granularity):
+    # Start of the first bucket beginning at or after `ms`
+    start = bucket_start(ms, granularity)
+    if start == ms:
+        return ms
+    # Half a bucket past the next boundary lands inside the next bucket, whatever the day's length
+    return bucket_start(start + GRANULARITIES[granularity][1] * 3 // 2 // timedelta(milliseconds=1), granularity)
+
+
+def query_rollups(source, start_ms, end_ms, granularity, cursor=None, limit=DEFAULT_PAGE_SIZE):
+    """
+    One page of buckets for `source` between start_ms and end_ms (exclusive), oldest
+    first. Pages are keyset-paginated: pass the returned cursor (the last bucket of the
+    page) to get the next one. Returns (rows, next cursor or None).
+    """
+    if cursor is not None:
+        condition, lower = "bucket > ?", int(cursor)
+    else:
+        condition, lower = "bucket >= ?", bucket_start(start_ms, granularity)
+
+    rows = get_db("readings").execute(f'''
+        SELECT bucket, count,
+               temperature_min, temperature_max, temperature_sum / count AS temperature_mean,
+               humidity_min, humidity_max, humidity_sum / count AS humidity_mean,
+               apparent_min, apparent_max, apparent_sum / count AS apparent_mean
+        FROM rollups
+        WHERE granularity = ? AND source_id = ? AND {condition} AND bucket < ?
+        ORDER BY bucket
+        LIMIT ?
+    ''', (granularity, SOURCE_IDS[source], lower, end_ms, limit + 1)).fetchall()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = rows[-1]["bucket"]
+    return rows, next_cursor
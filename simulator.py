@@ -0,0 +1,194 @@
+import math
+import time
+from typing import NamedTuple
+
+import numpy as np
+
+from apparent import calc_apparent_array
+from timestamps import SOURCE_NAMES, now_ms
+
+# Defaults for `flask simulate`
+SENSORS = 100
+ZONES = 4
+INTERVAL_SECONDS = 5.0      # Each sensor samples this often
+SPIKE_RATE = 0.2            # Heat spikes per sensor per hour
+SPIKE_MINUTES = (3, 15)     # Spike length range
+SPIKE_DEGREES = (3.0, 9.0)  # Spike height range, °C
+
+# Longest the emitter sleeps between checks for due sensors
+TICK_SECONDS = 0.25
+
+# Longest replay waits between batches, and most rows handed to the store at once
+REPLAY_MAX_SLEEP = 1.0
+REPLAY_BATCH_ROWS = 1000
+
+
+class RunStats(NamedTuple):
+    emitted: int        # Readings handed to the store
+    stored: int         # Readings the store reported as written (queued ones are not counted)
+    batches: int        # store() calls
+    seconds: float      # Wall-clock run time
+    max_lag: float      # Furthest the emitter fell behind schedule, seconds
+
+
+class SensorFleet:
+    """
+    N virtual inside sensors spread over zones. Each sensor has its own level, linear
+    calibration drift, daily cycle (peaking mid-afternoon local time), noise and
+    randomly timed heat spikes. State lives in NumPy arrays so a tick for hundreds of
+    sensors is a handful of vector operations.
+    """
+
+    def __init__(self, sensors=SENSORS, zones=ZONES, interval=INTERVAL_SECONDS, spike_rate=SPIKE_RATE,
+                 seed=None, start_ms=None):
+        self.rng = np.random.default_rng(seed)
+        self.interval = interval
+        self.spike_rate = spike_rate
+        self.start_ms = now_ms() if start_ms is None else start_ms
+        n = self.size = sensors
+
+        zone = np.arange(n) % zones
+        self.device_ids = [f"zone{z + 1}-s{i + 1:03d}" for i, z in enumerate(zone.tolist())]
+        zone_base = self.rng.uniform(27.0, 33.0, zones)       # Some zones sit near hot processes
+        self.base = zone_base[zone] + self.rng.normal(0, 0.8, n)
+        self.drift = self.rng.normal(0, 0.3, n) / 24           # °C per hour
+        self.amplitude = self.rng.uniform(1.5, 4.5, n)
+        self.base_rh = self.rng.uniform(45.0, 65.0, n)
+        self.noise = self.rng.uniform(0.1, 0.4, n)
+
+        # Stagger first samples across one interval so load is spread evenly
+        self.next_due = self.rng.uniform(0, interval, n)
+        self.spike_until = np.zeros(n)
+        self.spike_height = np.zeros(n)
+
+    def due(self, elapsed):
+        # Indices of sensors due at `elapsed` seconds into the run; advances their schedule
+        indices = np.flatnonzero(self.next_due <= elapsed)
+        self.next_due[indices] += self.interval
+        return indices
+
+    def sample(self, indices, ts):
+        """
+        Readings rows (ts, "inside", temperature, humidity, apparent, device_id) for the
+        given sensors at epoch-ms `ts`.
+        """
+        if not len(indices):
+            return []
+        hours = (ts - self.start_ms) / 3_600_000
+        local = time.localtime(ts / 1000)
+        day_fraction = (local.tm_hour * 3600 + local.tm_min * 60 + local.tm_sec) / 86400
+        cycle = math.cos(2 * math.pi * (day_fraction - 15 / 24))
+
+        # Start new spikes (Poisson arrivals), then add the active ones
+        chance = self.spike_rate * self.interval / 3600
+        starting = (self.rng.random(len(indices)) < chance) & (self.spike_until[indices] <= hours)
+        if starting.any():
+            started = indices[starting]
+            minutes = self.rng.uniform(*SPIKE_MINUTES, len(started))
+            self.spike_until[started] = hours + minutes / 60
+            self.spike_height[started] = self.rng.uniform(*SPIKE_DEGREES, len(started))
+        spike = np.where(self.spike_until[indices] > hours, self.spike_height[indices], 0.0)
+
+        temps = (self.base[indices] + self.drift[indices] * hours + self.amplitude[indices] * cycle
+                 + spike + self.rng.normal(0, 1, len(indices)) * self.noise[indices])
+        # Humidity falls as the air heats up
+        rhs = np.clip(self.base_rh[indices] - 2.0 * (temps - self.base[indices])
+                      + self.rng.normal(0, 1.5, len(indices)), 5.0, 100.0)
+        temps, rhs = np.round(temps, 1), np.round(rhs, 1)
+        apparents = calc_apparent_array(temps, rhs)
+        return [
+            (ts, "inside", temp, rh, apparent, self.device_ids[i])
+            for i, temp, rh, apparent in zip(indices.tolist(), temps.tolist(), rhs.tolist(), apparents.tolist())
+        ]
+
+
+def run_fleet(store, fleet, duration=None, should_stop=None, progress=None):
+    """
+    Emits the fleet's readings in real time through `store` (e.g. store_readings) until
+    `duration` seconds pass or `should_stop()` returns true. Time advances in ticks of
+    TICK_SECONDS, and each tick hands every due sensor's reading to the store in one
+    call, like a gateway forwarding its sensors. Lag counts only delay beyond one tick.
+    `progress` gets the RunStats so far about once a second.
+    """
+    started = time.monotonic()
+    emitted = stored = batches = 0
+    max_lag = 0.0
+    last_report = started
+    while True:
+        elapsed = time.monotonic() - started
+        if (duration is not None and elapsed >= duration) or (should_stop and should_stop()):
+            break
+        indices = fleet.due(elapsed)
+        if len(indices):
+            due = float(fleet.next_due[indices].min()) - fleet.interval
+            max_lag = max(max_lag, elapsed - due - TICK_SECONDS)
+            rows = fleet.sample(indices, now_ms())
+            result = store(rows)
+            emitted += len(rows)
+            stored += result or 0
+            batches += 1
+        now = time.monotonic()
+        if progress and now - last_report >= 1.0:
+            last_report = now
+            progress(RunStats(emitted, stored, batches, now - started, max_lag))
+        # Sleep to the next tick boundary, or further if no sensor is due by then
+        elapsed = now - started
+        next_tick = (math.floor(elapsed / TICK_SECONDS) + 1) * TICK_SECONDS
+        wait = max(next_tick, min(float(fleet.next_due.min()), elapsed + 1.0)) - elapsed
+        time.sleep(wait)
+    return RunStats(emitted, stored, batches, time.monotonic() - started, max_lag)
+
+
+def replay(store, chunks, speed=1.0, device_prefix="", should_stop=None, progress=None):
+    """
+    Plays historical readings back through `store` at `speed` times real time. `chunks`
+    yields lists of (ts, source_id, device_id, temperature, humidity, apparent) rows in
+    ts order (export.iter_readings). Readings are re-stamped from the replay's start
+    time with the gaps between them divided by `speed`, so they arrive as live data and
+    never collide with the original rows.
+    """
+    started = time.monotonic()
+    started_ms = now_ms()
+    first_ts = None
+    emitted = stored = batches = 0
+    max_lag = 0.0
+    last_report = started
+    pending = []
+    pending_due = 0.0
+
+    def flush():
+        nonlocal emitted, stored, batches
+        if pending:
+            result = store(list(pending))
+            emitted += len(pending)
+            stored += result or 0
+            batches += 1
+            pending.clear()
+
+    for rows in chunks:
+        for ts, source_id, device_id, temperature, humidity, apparent in rows:
+            if first_ts is None:
+                first_ts = ts
+            due = (ts - first_ts) / 1000 / speed
+            # Rows due within one tick of the batch head go out together
+            if pending and (due - pending_due > TICK_SECONDS or len(pending) >= REPLAY_BATCH_ROWS):
+                flush()
+            if not pending:
+                pending_due = due
+                while True:
+                    if should_stop and should_stop():
+                        return RunStats(emitted, stored, batches, time.monotonic() - started, max_lag)
+                    wait = pending_due - (time.monotonic() - started)
+                    if wait <= 0:
+                        max_lag = max(max_lag, -wait)
+                        break
+                    time.sleep(min(wait, REPLAY_MAX_SLEEP))
+            replay_ts = started_ms + round((ts - first_ts) / speed)
+            pending.append((replay_ts, SOURCE_NAMES[source_id], temperature, humidity, apparent,
+                            device_prefix + device_id))
+        now = time.monotonic()
+        if progress and now - last_report >= 1.0:
+            last_report = now
+            progress(RunStats(emitted, stored, batches, now - started, max_lag))
+    flush()
+    return RunStats(emitted, stored, batches, time.monotonic() - started, max_lag)
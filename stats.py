@@ -0,0 +1,212 @@
+import math
+import threading
+from array import array
+
+from db import get_db
+from timestamps import SOURCE_NAMES, format_iso
+
+# Sliding windows tracked per sensor: (name, seconds)
+WINDOWS = (("15m", 900), ("1h", 3600))
+WINDOW_BUCKETS = 30         # Sub-buckets per window; min/max expire one bucket at a time
+
+EWMA_SECONDS = 300          # Time constant of the smoothed apparent temperature
+TREND_SECONDS = 600         # Time constant of the smoothed rate of change
+MAX_GAP_SECONDS = 1800      # A longer silence restarts the smoothing from the next reading
+HORIZON_MINUTES = 120       # Crossings projected further out than this are not reported
+MIN_TREND = 0.01 / 60       # °C per second treated as flat
+
+WARM_SECONDS = 3600         # History replayed into the statistics at startup
+
+
+class WindowMinMax:
+    """
+    Minimum and maximum over a sliding time window in constant memory: the window is
+    split into `buckets` slots keyed by bucket number, each holding its own min/max, and
+    stale slots are skipped when reading. Edges are exact to one bucket width.
+    """
+    __slots__ = ("width", "buckets", "ids", "mins", "maxs")
+
+    def __init__(self, seconds, buckets=WINDOW_BUCKETS):
+        self.width = seconds * 1000 // buckets
+        self.buckets = buckets
+        self.ids = array("q", [-1] * buckets)
+        self.mins = array("d", [0.0] * buckets)
+        self.maxs = array("d", [0.0] * buckets)
+
+    def add(self, ts, value):
+        bucket = ts // self.width
+        slot = bucket % self.buckets
+        if self.ids[slot] != bucket:
+            self.ids[slot], self.mins[slot], self.maxs[slot] = bucket, value, value
+        else:
+            self.mins[slot] = min(self.mins[slot], value)
+            self.maxs[slot] = max(self.maxs[slot], value)
+
+    def extremes(self, now):
+        # (min, max) over the window ending at epoch-ms `now`, or (None, None) when empty
+        oldest = now // self.width - self.buckets + 1
+        live = [slot for slot in range(self.buckets) if self.ids[slot] >= oldest]
+        if not live:
+            return None, None
+        return min(self.mins[slot] for slot in live), max(self.maxs[slot] for slot in live)
+
+
+class SensorStats:
+    """
+    Running statistics for one sensor's apparent temperature: an EWMA, a Holt-style
+    smoothed level and trend (°C per second) for projections, and sliding-window
+    min/max. Smoothing factors follow the actual gap between readings, so irregular
+    sampling is handled.
+    """
+    __slots__ = ("last_ts", "latest", "ewma", "level", "trend", "windows")
+
+    def __init__(self):
+        self.last_ts = None
+        self.latest = self.ewma = self.level = None
+        self.trend = 0.0
+        self.windows = [WindowMinMax(seconds) for _, seconds in WINDOWS]
+
+    def add(self, ts, value):
+        if self.last_ts is not None and ts <= self.last_ts:
+            return  # Late or duplicate reading
+        for window in self.windows:
+            window.add(ts, value)
+        dt = (ts - self.last_ts) / 1000 if self.last_ts is not None else None
+        if dt is None or dt > MAX_GAP_SECONDS:
+            self.ewma = self.level = value
+            self.trend = 0.0
+        else:
+            alpha = 1 - math.exp(-dt / EWMA_SECONDS)
+            self.ewma += alpha * (value - self.ewma)
+            # Holt: predict the level forward, correct toward the reading, then update the slope
+            previous = self.level
+            predicted = previous + self.trend * dt
+            self.level = predicted + alpha * (value - predicted)
+            beta = 1 - math.exp(-dt / TREND_SECONDS)
+            self.trend += beta * ((self.level - previous) / dt - self.trend)
+        self.last_ts, self.latest = ts, value
+
+    def minutes_to(self, boundary):
+        # Projected minutes until the smoothed level reaches `boundary`, or None if not heading there
+        gap = boundary - self.level
+        if abs(self.trend) < MIN_TREND or gap * self.trend <= 0:
+            return None
+        minutes = gap / self.trend / 60
+        return round(minutes, 1) if minutes <= HORIZON_MINUTES else None
+
+    def forecast(self, thresholds):
+        """
+        Where the trend is heading against the bands: the next band edge in the direction
+        of travel and the Safe limit, each with projected minutes (None when the crossing
+        is flat, behind us or beyond the horizon).
+        """
+        index = thresholds.classify_index(self.level)
+        if self.trend > 0 and index < len(thresholds.boundaries):
+            boundary, label = thresholds.boundaries[index], thresholds.labels[index + 1]
+        elif self.trend < 0 and index > 0:
+            boundary, label = thresholds.boundaries[index - 1], thresholds.labels[index - 1]
+        else:
+            boundary = label = None
+        below_safe = self.level <= thresholds.safe_limit
+        return {
+            "next_level": label,
+            "boundary": boundary,
+            "minutes_to_next_level": self.minutes_to(boundary) if boundary is not None else None,
+            "minutes_to_safe_limit": self.minutes_to(thresholds.safe_limit) if below_safe else None,
+        }
+
+    def snapshot(self, thresholds):
+        windows = {}
+        for (name, _), window in zip(WINDOWS, self.windows):
+            low, high = window.extremes(self.last_ts)
+            windows[name] = {"min": low, "max": high}
+        return {
+            "timestamp": format_iso(self.last_ts),
+            "latest": self.latest,
+            "ewma": round(self.ewma, 2),
+            "level": round(self.level, 2),
+            "trend_per_10_min": round(self.trend * 600, 2),
+            "windows": windows,
+            **self.forecast(thresholds),
+        }
+
+
+class StreamingStats:
+    """
+    SensorStats for every (source, device_id) seen, fed by insert_readings() alongside
+    the recent-readings buffers, so /api/stats and the dashboard never query SQLite.
+    """
+
+    def __init__(self):
+        self._sensors = {}
+        self._lock = threading.Lock()
+
+    def add_rows(self, rows):
+        # rows: (ts, source, temperature, humidity, apparent, device_id) as stored by insert_readings
+        with self._lock:
+            for ts, source, _, _, apparent, device_id in sorted(rows, key=lambda row: row[0]):
+                sensor = self._sensors.get((source, device_id))
+                if sensor is None:
+                    sensor = self._sensors[(source, device_id)] = SensorStats()
+                sensor.add(ts, apparent)
+
+    def snapshot(self, thresholds):
+        with self._lock:
+            return [
+                {"source": source, "device_id": device_id, **sensor.snapshot(thresholds)}
+                for (source, device_id), sensor in sorted(self._sensors.items())
+            ]
+
+    def summary(self, source, thresholds):
+        """
+        Dashboard line for a source: the sensor projected to cross the Safe limit (or
+        else its next band edge) soonest, falling back to the most recently updated one.
+        """
+        with self._lock:
+            sensors = [(device_id, sensor) for (src, device_id), sensor in self._sensors.items() if src == source]
+            if not sensors:
+                return None
+            candidates = []
+            for device_id, sensor in sensors:
+                forecast = sensor.forecast(thresholds)
+                minutes = forecast["minutes_to_safe_limit"]
+                if minutes is None:
+                    minutes = forecast["minutes_to_next_level"]
+                if minutes is not None:
+                    candidates.append((minutes, device_id, sensor, forecast))
+            if candidates:
+                minutes, device_id, sensor, forecast = min(candidates, key=lambda c: c[0])
+            else:
+                device_id, sensor = max(sensors, key=lambda item: item[1].last_ts)
+                forecast = sensor.forecast(thresholds)
+            return {"device_id": device_id, "trend_per_10_min": round(sensor.trend * 600, 2), **forecast}
+
+    def warm(self, seconds=WARM_SECONDS):
+        # Replay the last `seconds` of each source's readings (run once at startup)
+        conn = get_db("readings")
+        with self._lock:
+            self._sensors.clear()
+        for source_id in SOURCE_NAMES:
+            rows = conn.execute('''
+                SELECT ts, temperature, humidity, apparent, device_id
+                FROM readings
+                WHERE source_id = ? AND ts >= (SELECT max(ts) FROM readings WHERE source_id = ?) - ?
+                ORDER BY ts
+            ''', (source_id, source_id, seconds * 1000)).fetchall()
+            source = SOURCE_NAMES[source_id]
+            self.add_rows([(ts, source, temp, rh, apparent, device_id) for ts, temp, rh, apparent, device_id in rows])
+
+
+def describe(summary):
+    # Short dashboard text for StreamingStats.summary(), e.g. "Safe limit in ~18 min"
+    if summary is None:
+        return "Not enough data"
+    if summary["minutes_to_safe_limit"] is not None:
+        return f"Safe limit in ~{summary['minutes_to_safe_limit']:.0f} min"
+    if summary["minutes_to_next_level"] is not None:
+        return f"{summary['next_level']} in ~{summary['minutes_to_next_level']:.0f} min"
+    return f"No band change expected within {HORIZON_MINUTES // 60} h"
+
+
+# Shared by the whole process
+stats = StreamingStats()
@@ -0,0 +1,26 @@
+import pytest
+
+import app as appmod
+from alerts import MemorySink
+from bench.bomstub import BomStub
+
+
+@pytest.fixture
+def make_app(tmp_path):
+    # create_app() on fresh databases in a temporary directory; keyword arguments override config
+    def make(**config):
+        databases = {name: str(tmp_path / f"{name}.db") for name in ("users", "readings", "settings")}
+        return appmod.create_app({"DATABASES": databases, "BOM_STATIONS": [], **config})
+    return make
+
+
+@pytest.fixture
+def sink():
+    return MemorySink()
+
+
+@pytest.fixture
+def bom_stub():
+    stub = BomStub().start()
+    yield stub
+    stub.stop()
@@ -0,0 +1,79 @@
+import app as appmod
+from db import get_db
+from timestamps import now_ms
+
+# Apparent temperatures inside each default band (see thresholds.DEFAULT_BANDS)
+SAFE, MODERATE, HIGH, VERY_HIGH = 22.0, 28.0, 32.0, 40.0
+
+
+def store(app, readings, device_id="s1"):
+    # Insert (ts, apparent) readings for one inside sensor; the engine runs straight after the insert
+    with app.app_context():
+        appmod.insert_readings([(ts, "inside", apparent, 50.0, apparent, device_id) for ts, apparent in readings])
+
+
+def transitions(sink):
+    return [(alert.previous, alert.level) for alert in sink.alerts]
+
+
+def test_new_level_must_hold_for_min_seconds(make_app, sink):
+    app = make_app(ALERT_SINK=sink)
+    start = now_ms() - 300_000
+    store(app, [(start, VERY_HIGH), (start + 30_000, VERY_HIGH)])
+    assert transitions(sink) == []
+    store(app, [(start + 60_000, VERY_HIGH)])
+    assert transitions(sink) == [("Safe", "Very High Risk")]
+
+
+def test_short_excursion_raises_nothing(make_app, sink):
+    app = make_app(ALERT_SINK=sink)
+    start = now_ms() - 300_000
+    store(app, [(start, SAFE), (start + 30_000, HIGH), (start + 50_000, SAFE), (start + 120_000, SAFE)])
+    assert transitions(sink) == []
+
+
+def test_hysteresis_keeps_the_level_until_clearly_below_the_band(make_app, sink):
+    app = make_app(ALERT_SINK=sink, ALERT_MIN_SECONDS=0)
+    start = now_ms() - 300_000
+    store(app, [(start, HIGH)])
+    assert transitions(sink) == [("Safe", "High Risk")]
+    # Just under the High Risk edge (30) but within the 0.5 hysteresis
+    store(app, [(start + i * 30_000, 29.8) for i in range(1, 5)])
+    assert transitions(sink) == [("Safe", "High Risk")]
+    store(app, [(start + 150_000, 29.4)])
+    assert transitions(sink) == [("Safe", "High Risk"), ("High Risk", "Moderate Risk")]
+
+
+def test_restart_resumes_from_the_cursor(make_app, sink):
+    app = make_app(ALERT_SINK=sink)
+    start = now_ms() - 600_000
+    readings = [(start + i * 30_000, VERY_HIGH) for i in range(6)]
+    store(app, readings[:3])
+    assert transitions(sink) == [("Safe", "Very High Risk")]
+
+    # A new process over the same databases restores the sensor state and cursor: re-sent
+    # readings are neither re-evaluated nor counted again, and exposure carries on exactly
+    app = make_app(ALERT_SINK=sink)
+    store(app, readings)
+    assert transitions(sink) == [("Safe", "Very High Risk")]
+    with app.app_context():
+        conn = get_db("readings")
+        seconds = conn.execute("SELECT sum(seconds) FROM exposure").fetchone()[0]
+        cursor = conn.execute("SELECT reading_id FROM alert_progress").fetchone()[0]
+        newest = conn.execute("SELECT max(id) FROM readings").fetchone()[0]
+    assert seconds == 150
+    assert cursor == newest
+
+
+def test_rows_stored_by_another_process_are_evaluated(make_app, sink):
+    app = make_app(ALERT_SINK=sink)
+    start = now_ms() - 300_000
+    with app.app_context():
+        # Written straight to the table, as another worker would, without this engine running
+        with get_db("readings") as conn:
+            conn.executemany('''
+                INSERT INTO readings (ts, source_id, temperature, humidity, apparent, device_id)
+                VALUES (?, 1, ?, 50, ?, 's1')
+            ''', [(start + i * 30_000, VERY_HIGH, VERY_HIGH) for i in range(3)])
+        appmod.evaluate_alerts()
+    assert transitions(sink) == [("Safe", "Very High Risk")]
@@ -0,0 +1,75 @@
+import pytest
+
+from bench.bomstub import FEED_LENGTH, BomStub
+from bom import BomPoller, Station
+
+
+@pytest.fixture
+def second_stub():
+    stub = BomStub().start()
+    yield stub
+    stub.stop()
+
+
+def station(stub, station_id="94576"):
+    return {"id": station_id, "name": f"Stub {station_id}", "url": stub.url}
+
+
+def poll(app):
+    with app.app_context():
+        return {result.station: result for result in app.extensions["bom_poller"].poll()}
+
+
+def test_poll_stores_only_new_observations(make_app, bom_stub):
+    app = make_app(BOM_STATIONS=[station(bom_stub)])
+    first = poll(app)["94576"]
+    assert (first.status, first.stored) == ("updated", FEED_LENGTH)
+    second = poll(app)["94576"]
+    assert (second.status, second.stored) == ("updated", 1)
+
+
+def test_unchanged_feed_is_skipped_with_conditional_get(make_app, bom_stub):
+    bom_stub.advancing = False
+    app = make_app(BOM_STATIONS=[station(bom_stub)])
+    assert poll(app)["94576"].status == "updated"
+    assert poll(app)["94576"].status == "not_modified"
+    assert bom_stub.not_modified == 1
+
+
+def test_failing_station_does_not_stop_the_others(make_app, bom_stub, second_stub):
+    bom_stub.status = 503
+    app = make_app(BOM_STATIONS=[station(bom_stub, "A"), station(second_stub, "B")])
+    results = poll(app)
+    assert results["A"].status == "error" and "503" in results["A"].error
+    assert (results["B"].status, results["B"].stored) == ("updated", FEED_LENGTH)
+
+    bom_stub.status = None
+    results = poll(app)
+    assert (results["A"].status, results["A"].stored) == ("updated", FEED_LENGTH)
+    assert (results["B"].status, results["B"].stored) == ("updated", 1)
+
+
+def test_store_error_is_reported_and_refetched(make_app, bom_stub, second_stub):
+    # A station whose rows fail to store gets an error result; the other is stored, and the
+    # failed one is fetched again in full next time rather than skipped with 304
+    bom_stub.advancing = second_stub.advancing = False
+    app = make_app()
+    failing = {"A"}
+
+    def store(rows):
+        if rows[0][5] in failing:
+            raise RuntimeError("disk I/O error")
+        return len(rows)
+
+    poller = BomPoller([Station("A", "A", bom_stub.url), Station("B", "B", second_stub.url)], store)
+    with app.app_context():
+        results = {result.station: result for result in poller.poll()}
+        assert results["A"].status == "error" and "disk I/O error" in results["A"].error
+        assert (results["B"].status, results["B"].stored) == ("updated", FEED_LENGTH)
+
+        failing.clear()
+        results = {result.station: result for result in poller.poll()}
+    assert (results["A"].status, results["A"].stored) == ("updated", FEED_LENGTH)
+    assert results["B"].status == "not_modified"
+    assert bom_stub.not_modified == 0
+    poller.close()
@@ -0,0 +1,93 @@
+import threading
+
+import pytest
+
+from writer import BatchTooLarge, QueueFull, WriteBehindQueue
+
+
+class BlockedStore:
+    # store() for a writer that holds its first batch until released
+    def __init__(self):
+        self.rows = []
+        self.release = threading.Event()
+        self.started = threading.Event()
+
+    def __call__(self, rows):
+        self.started.set()
+        self.release.wait(5)
+        self.rows.extend(rows)
+
+
+def test_full_queue_refuses_the_whole_submission():
+    store = BlockedStore()
+    writer = WriteBehindQueue(store, queue_size=10, batch_size=4, flush_seconds=0.01, put_timeout=0.1)
+    writer.start()
+    writer.submit(list(range(4)))
+    assert store.started.wait(5)            # Those four are now with the writer
+    writer.submit(list(range(4, 10)))
+
+    with pytest.raises(QueueFull):
+        writer.submit(list(range(10, 15)))  # Room for 4 of 5: none are queued
+    assert writer.depth() == 6
+    assert writer.metrics()["rejected"] == 5
+
+    store.release.set()
+    writer.submit(list(range(10, 15)))
+    writer.close()
+    assert store.rows == list(range(15))
+
+
+def test_batch_larger_than_the_queue_is_refused_at_once():
+    writer = WriteBehindQueue(lambda rows: None, queue_size=10, put_timeout=5)
+    with pytest.raises(BatchTooLarge):
+        writer.submit(list(range(11)))
+    assert writer.depth() == 0
+
+
+def test_rows_accepted_while_closing_are_written():
+    written = []
+    writer = WriteBehindQueue(written.extend, queue_size=1000, put_timeout=0.5)
+    writer.start()
+    accepted = []
+
+    def submitter(k):
+        for i in range(50):
+            try:
+                writer.submit([(k, i)])
+            except QueueFull:
+                return
+            accepted.append((k, i))
+
+    threads = [threading.Thread(target=submitter, args=(k,)) for k in range(8)]
+    for thread in threads:
+        thread.start()
+    writer.close()
+    for thread in threads:
+        thread.join()
+    assert sorted(written) == sorted(accepted)
+
+
+def test_full_queue_answers_503_and_oversized_batch_413(make_app):
+    app = make_app(WRITE_BEHIND=True, WRITE_BEHIND_QUEUE_SIZE=10)
+    write_behind = app.extensions["write_behind"]
+    store = BlockedStore()
+    write_behind.store = store
+    write_behind.put_timeout = 0.1
+    client = app.test_client()
+    reading = {"device_id": "d1", "temperature": 30, "humidity": 50}
+    try:
+        assert client.post("/ingest/inside/batch", json=[reading]).status_code == 202
+        assert store.started.wait(5)
+        assert client.post("/ingest/inside/batch", json=[reading] * 10).status_code == 202
+
+        response = client.post("/ingest/inside/batch", json=[reading])
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "1"
+
+        response = client.post("/ingest/inside/batch", json=[reading] * 11)
+        assert response.status_code == 413
+        assert "Retry-After" not in response.headers
+    finally:
+        store.release.set()
+        write_behind.close()
+    assert len(store.rows) == 11
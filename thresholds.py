@@ -0,0 +1,141 @@
+import os
+import threading
+from bisect import bisect_left
+from typing import NamedTuple
+
+import numpy as np
+
+from db import get_db, DATABASES
+
+
+class Band(NamedTuple):
+    lower: float    # temperature_from (°C)
+    upper: float    # temperature_to (°C)
+    label: str      # threshold_level, e.g. "Safe"
+
+
+# Used when the thresholds table is empty or missing
+DEFAULT_BANDS = (
+    Band(18, 26, "Safe"),
+    Band(26, 30, "Moderate Risk"),
+    Band(30, 35, "High Risk"),
+    Band(35, 100, "Very High Risk"),
+)
+
+# Upper safe limit when no band is labelled "Safe"
+DEFAULT_SAFE_LIMIT = 26
+
+# CSS suffix (status-<suffix>) and short display name for each risk level
+LEVEL_STYLES = {
+    "Safe": ("safe", "Safe"),
+    "Moderate Risk": ("moderate", "Moderate"),
+    "High Risk": ("high", "High"),
+    "Very High Risk": ("very-high", "Very High"),
+}
+
+
+class Thresholds(NamedTuple):
+    """
+    Immutable snapshot of the thresholds table, compiled for classification.
+
+    Band i covers apparent temperatures in (boundaries[i-1], boundaries[i]], so a value
+    equal to a band's upper bound still belongs to that band. Values below the first band
+    fall into it, and values above the last band fall into the last one.
+    """
+    bands: tuple
+    safe_limit: float       # Upper bound of the "Safe" band, the alert limit used across the app
+    boundaries: tuple       # Upper bounds of every band but the last, ascending
+    labels: tuple           # threshold_level per band
+
+    @classmethod
+    def from_bands(cls, bands):
+        bands = tuple(sorted(bands, key=lambda band: band.lower))
+        safe_limit = next((band.upper for band in bands if band.label.lower() == "safe"), DEFAULT_SAFE_LIMIT)
+        boundaries = tuple(float(band.upper) for band in bands[:-1])
+        labels = tuple(band.label for band in bands)
+        return cls(bands, safe_limit, boundaries, labels)
+
+    def classify_index(self, value):
+        # Index of the band containing a single apparent temperature
+        return bisect_left(self.boundaries, value)
+
+    def classify(self, value):
+        # Band containing a single apparent temperature
+        return self.bands[self.classify_index(value)]
+
+    def classify_many(self, values):
+        # Band index for every value of an array-like, in one vectorized call
+        return np.searchsorted(np.asarray(self.boundaries), np.asarray(values, dtype=float), side="left")
+
+    def labels_for(self, values):
+        # threshold_level for every value of an array-like
+        return np.asarray(self.labels, dtype=object)[self.classify_many(values)]
+
+    def exceeds_safe(self, value):
+        # True when an apparent temperature is above the Safe band's upper limit
+        return value > self.safe_limit
+
+    def as_rows(self):
+        # Rows in the {"from", "to", "label"} shape threshold.html expects
+        return [{"from": band.lower, "to": band.upper, "label": band.label} for band in self.bands]
+
+
+def level_style(label):
+    # (css suffix, short name) for a threshold_level; unknown labels are styled as the highest risk
+    return LEVEL_STYLES.get(label, ("very-high", label))
+
+
+_lock = threading.Lock()
+_cached = None
+_cached_signature = None
+
+
+def _file_signature():
+    # settings.db plus its WAL file: a commit from any process changes one of them
+    path = DATABASES["settings"]
+    signature = []
+    for name in (path, path + "-wal"):
+        try:
+            stat = os.stat(name)
+        except FileNotFoundError:
+            signature.append(None)
+        else:
+            signature.append((stat.st_mtime_ns, stat.st_size))
+    return tuple(signature)
+
+
+def _load():
+    conn = get_db("settings")
+    rows = conn.execute('''
+        SELECT temperature_from, temperature_to, threshold_level
+        FROM thresholds
+        ORDER BY temperature_from ASC
+    ''').fetchall()
+    if not rows:
+        return Thresholds.from_bands(DEFAULT_BANDS)
+    return Thresholds.from_bands(Band(row[0], row[1], row[2]) for row in rows)
+
+
+def get_thresholds():
+    """
+    Returns the current Thresholds, reading settings.db only when it has changed
+    since the last load (a stat() call per lookup instead of a query).
+    """
+    global _cached, _cached_signature
+    signature = _file_signature()
+    cached = _cached
+    if cached is not None and signature == _cached_signature:
+        return cached
+    with _lock:
+        if _cached is None or signature != _cached_signature:
+            _cached = _load()
+            _cached_signature = signature
+        return _cached
+
+
+def invalidate():
+    # Drop the cached snapshot, e.g. right after this process saves new thresholds
+    global _cached, _cached_signature
+    with _lock:
+        _cached = None
+        _cached_signature = None
@@ -0,0 +1,150 @@
+import time
+from datetime import datetime, timedelta, timezone
+
+# Readings store their source as a small integer
+SOURCE_IDS = {"inside": 1, "outside": 2}
+SOURCE_NAMES = {source_id: name for name, source_id in SOURCE_IDS.items()}
+
+# Rows copied per transaction by migrate_readings()
+MIGRATION_CHUNK_SIZE = 10000
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_MILLISECOND = timedelta(milliseconds=1)
+
+
+# Readings are stored as integer epoch milliseconds (UTC). Naive date-times, from older
+# databases and from clients, are taken to be in the server's local time zone, which is
+# also the zone used when times are shown.
+
+def now_ms():
+    return time.time_ns() // 1_000_000
+
+
+def to_ms(moment):
+    # datetime (aware, or naive local time) -> epoch milliseconds
+    if moment.tzinfo is None:
+        moment = moment.astimezone()
+    return (moment - _EPOCH) // _MILLISECOND
+
+
+# Epoch-ms range that can be stored and shown: datetime covers years 1 to 9999 (less a day for time zones)
+MIN_MS = to_ms(datetime(1, 1, 2, tzinfo=timezone.utc))
+MAX_MS = to_ms(datetime(9999, 12, 31, tzinfo=timezone.utc))
+
+
+def parse_iso_ms(text):
+    # ISO 8601 string -> epoch milliseconds; raises ValueError
+    return to_ms(datetime.fromisoformat(text))
+
+
+def local_datetime(ms):
+    # Epoch milliseconds -> aware datetime in the server's local time zone
+    return (_EPOCH + ms * _MILLISECOND).astimezone()
+
+
+def format_iso(ms):
+    return local_datetime(ms).isoformat(timespec="milliseconds")
+
+
+def format_date(ms):
+    return local_datetime(ms).strftime("%Y-%m-%d")
+
+
+def format_time(ms):
+    return local_datetime(ms).strftime("%H:%M:%S")
+
+
+def format_datetime(ms):
+    return local_datetime(ms).strftime("%Y-%m-%d %H:%M")
+
+
+READINGS_SCHEMA = '''
+    CREATE TABLE {name} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        ts INTEGER NOT NULL,                                -- Epoch milliseconds, UTC
+        source_id INTEGER CHECK(source_id IN (1, 2)) NOT NULL,  -- 1 = inside, 2 = outside
+        temperature REAL NOT NULL,
+        humidity REAL NOT NULL,
+        apparent REAL NOT NULL,
+        device_id TEXT NOT NULL DEFAULT ''                  -- Sensor ID, or BOM station ID for outside
+    )
+'''
+
+# Serves "latest N per source" and range queries, and lets inserts skip duplicates with ON CONFLICT DO NOTHING
+READINGS_INDEX = '''
+    CREATE UNIQUE INDEX idx_readings_source_timestamp
+    ON readings (source_id, ts, device_id)
+'''
+
+
+def migrate_readings(conn, legacy_station_id, station_zones=None, chunk_size=MIGRATION_CHUNK_SIZE, progress=None):
+    """
+    Converts a readings table with ISO text timestamps and text sources to the integer
+    layout, streaming it in id order one chunk per transaction into readings_new. An
+    interrupted run resumes from the last copied id. Duplicate rows are dropped, and
+    outside rows without a station are assigned `legacy_station_id`. Outside rows were
+    stored in their BOM station's local time, so they are read in that station's zone
+    from `station_zones` (station id -> tzinfo); other naive timestamps are server-local.
+    Derived tables built on the old layout (rollups) are dropped so they can be rebuilt.
+    `progress` is called with (rows copied, total rows) after each chunk.
+    """
+    station_zones = station_zones or {}
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(readings)")]
+    device = "device_id" if "device_id" in columns else "''"
+
+    with conn:
+        new_exists = conn.execute('''
+            SELECT count(*) FROM sqlite_master WHERE type='table' AND name='readings_new'
+        ''').fetchone()[0]
+        if not new_exists:
+            conn.execute(READINGS_SCHEMA.format(name="readings_new"))
+            conn.execute('''
+                CREATE UNIQUE INDEX idx_readings_new_source_timestamp
+                ON readings_new (source_id, ts, device_id)
+            ''')
+
+    last_id = conn.execute("SELECT coalesce(max(id), 0) FROM readings_new").fetchone()[0]
+    total = conn.execute("SELECT count(*) FROM readings").fetchone()[0]
+    done = conn.execute("SELECT count(*) FROM readings WHERE id <= ?", (last_id,)).fetchone()[0]
+
+    while True:
+        chunk = conn.execute(f'''
+            SELECT id, timestamp, source, temperature, humidity, apparent, {device}
+            FROM readings
+            WHERE id > ?
+            ORDER BY id
+            LIMIT ?
+        ''', (last_id, chunk_size)).fetchall()
+        if not chunk:
+            break
+        rows = []
+        for row_id, timestamp, source, temperature, humidity, apparent, device_id in chunk:
+            moment = datetime.fromisoformat(timestamp)
+            if source == "outside":
+                device_id = device_id or legacy_station_id
+                if moment.tzinfo is None:
+                    moment = moment.replace(tzinfo=station_zones.get(device_id))
+            rows.append((row_id, to_ms(moment), SOURCE_IDS[source], temperature, humidity, apparent, device_id))
+        with conn:
+            conn.executemany('''
+                INSERT OR IGNORE INTO readings_new (id, ts, source_id, temperature, humidity, apparent, device_id)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', rows)
+        last_id = chunk[-1][0]
+        done += len(chunk)
+        if progress:
+            progress(done, total)
+
+    # Swap the tables in one transaction (sqlite3 would otherwise autocommit each DDL statement)
+    with conn:
+        conn.execute("BEGIN")
+        conn.execute("DROP TRIGGER IF EXISTS readings_rollup")
+        conn.execute("DROP TABLE IF EXISTS rollups")
+        conn.execute("DROP TABLE readings")
+        conn.execute("DROP INDEX idx_readings_new_source_timestamp")
+        conn.execute("ALTER TABLE readings_new RENAME TO readings")
+        conn.execute(READINGS_INDEX)
+
+    # Give the space taken by the text columns back to the file system (also switching on the
+    # incremental vacuum requested in db.PRAGMAS)
+    conn.execute("VACUUM")
@@ -0,0 +1,149 @@
+import logging
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Defaults for the WRITE_BEHIND_* settings
+QUEUE_SIZE = 50000          # Readings buffered before ingest requests are pushed back
+BATCH_SIZE = 1000           # Readings committed per transaction at most
+FLUSH_SECONDS = 0.05        # Longest a reading waits for more to join its transaction
+PUT_TIMEOUT = 1.0           # Seconds an ingest request waits for room before giving up
+WRITE_RETRIES = 5           # Attempts per batch before it is dropped (and logged)
+
+
+class QueueFull(Exception):
+    """The write-behind queue had no room for a whole submission within PUT_TIMEOUT seconds."""
+
+
+class BatchTooLarge(Exception):
+    """A submission holds more rows than the whole queue, so retrying it can never succeed."""
+
+
+class WriteBehindQueue:
+    """
+    Bounded queue of readings rows drained by one writer thread, which commits them
+    in group transactions of up to `batch_size` rows or every `flush_seconds`,
+    whichever comes first. `store` is called on the writer thread with a list of rows.
+    """
+
+    def __init__(self, store, queue_size=QUEUE_SIZE, batch_size=BATCH_SIZE,
+                 flush_seconds=FLUSH_SECONDS, put_timeout=PUT_TIMEOUT):
+        self.store = store
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.put_timeout = put_timeout
+        self.capacity = queue_size
+        # Rows submitted and not yet taken by the writer; submit() reserves room for a whole batch at once
+        self._queue = queue.Queue()
+        self._reserved = 0
+        self._room = threading.Condition()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._stats_lock = threading.Lock()
+        self.stats = {
+            "enqueued": 0,      # Rows accepted into the queue
+            "written": 0,       # Rows handed to store() successfully
+            "batches": 0,       # Group transactions committed
+            "rejected": 0,      # Rows refused because the queue was full
+            "dropped": 0,       # Rows lost after WRITE_RETRIES failed attempts
+            "max_depth": 0,     # Highest queue depth seen
+        }
+
+    def _count(self, name, amount=1):
+        with self._stats_lock:
+            self.stats[name] += amount
+
+    def depth(self):
+        return self._queue.qsize()
+
+    def metrics(self):
+        with self._stats_lock:
+            return dict(self.stats, depth=self.depth(), capacity=self.capacity)
+
+    def start(self, wrap=None):
+        # `wrap` is an optional context manager factory (e.g. app.app_context) held for the thread's life
+        def run():
+            if wrap is None:
+                self._run()
+            else:
+                with wrap():
+                    self._run()
+
+        self._thread = threading.Thread(target=run, name="write-behind", daemon=True)
+        self._thread.start()
+
+    def submit(self, rows):
+        """
+        Queues rows for the writer, all or none of them: blocks up to put_timeout for
+        room for the whole list, then raises QueueFull without queueing any, so a
+        client retrying the request does not store the rows twice. Raises BatchTooLarge
+        for more rows than the queue holds.
+        """
+        if len(rows) > self.capacity:
+            self._count("rejected", len(rows))
+            raise BatchTooLarge(f"Batch larger than the write-behind queue ({self.capacity} readings)")
+        # Checked and queued under the lock close() takes, so rows are either refused or written before it returns
+        with self._room:
+            self._room.wait_for(lambda: self._stopping.is_set() or self._reserved + len(rows) <= self.capacity,
+                                self.put_timeout)
+            if self._stopping.is_set():
+                raise QueueFull("Write-behind queue is shutting down")
+            if self._reserved + len(rows) > self.capacity:
+                self._count("rejected", len(rows))
+                raise QueueFull(f"Write-behind queue full ({self.capacity} readings)")
+            self._reserved += len(rows)
+            for row in rows:
+                self._queue.put(row)
+        self._count("enqueued", len(rows))
+        depth = self.depth()
+        with self._stats_lock:
+            if depth > self.stats["max_depth"]:
+                self.stats["max_depth"] = depth
+
+    def _next_batch(self):
+        # Wait for one row, then gather more until the batch is full or flush_seconds has passed
+        try:
+            batch = [self._queue.get(timeout=0.2)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.flush_seconds
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        with self._room:
+            self._reserved -= len(batch)
+            self._room.notify_all()
+        return batch
+
+    def _write(self, batch):
+        for attempt in range(1, WRITE_RETRIES + 1):
+            try:
+                self.store(batch)
+            except Exception:
+                logger.exception("Write-behind batch of %d failed (attempt %d)", len(batch), attempt)
+                time.sleep(0.1 * attempt)
+                continue
+            self._count("written", len(batch))
+            self._count("batches")
+            return
+        self._count("dropped", len(batch))
+        logger.error("Dropped %d readings after %d failed attempts", len(batch), WRITE_RETRIES)
+
+    def _run(self):
+        while not (self._stopping.is_set() and self._queue.empty()):
+            batch = self._next_batch()
+            if batch:
+                self._write(batch)
+
+    def close(self, timeout=30):
+        # Stop accepting rows, write everything still queued, and wait for the writer to finish
+        with self._room:
+            self._stopping.set()
+            self._room.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
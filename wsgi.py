@@ -0,0 +1,5 @@
+# Production entry point, `gunicorn wsgi:app` (settings in gunicorn.conf.py): the app with its scheduler and BOM
+# backfill running
+from app import create_app
+
+app = create_app({"START_BACKGROUND": True})